@@ -1,6 +1,11 @@
 from dify_plugin import Plugin, DifyPluginEnv
 
-plugin = Plugin(DifyPluginEnv(MAX_REQUEST_TIMEOUT=120))
+from utils.deadline import MAX_REQUEST_TIMEOUT
+from utils.jobs import job_queue
+
+plugin = Plugin(DifyPluginEnv(MAX_REQUEST_TIMEOUT=MAX_REQUEST_TIMEOUT))
 
 if __name__ == '__main__':
+    # Jobs queued before a restart still have their media and are picked up again
+    job_queue.resume()
     plugin.run()
@@ -4,12 +4,18 @@ from requests_oauthlib import OAuth1Session
 from dify_plugin import ToolProvider
 from dify_plugin.errors.tool import ToolProviderCredentialValidationError
 
+from utils.deadline import Deadline
+
 
 class XProvider(ToolProvider):
+    VALIDATE_TIMEOUT = 30  # Credential check timeout (seconds)
+    
     def _validate_credentials(self, credentials: dict[str, Any]) -> None:
         """
         Validate the X API credentials by attempting to verify credentials
         """
+        deadline = Deadline.start()
+        
         try:
             # Check if all required credentials are provided
             required_credentials = ["api_key", "api_secret", "access_token", "access_token_secret"]
@@ -26,7 +32,7 @@ class XProvider(ToolProvider):
             )
             
             # Make a simple API call to verify credentials (get account info)
-            response = oauth.get("https://api.twitter.com/2/users/me")
+            response = oauth.get("https://api.twitter.com/2/users/me", timeout=deadline.timeout(self.VALIDATE_TIMEOUT, "verify the credentials"))
             
             if response.status_code != 200:
                 raise ValueError(f"Invalid credentials. API response: {response.status_code} {response.text}")
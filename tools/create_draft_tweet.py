@@ -7,6 +7,8 @@ from datetime import datetime
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils.similarity import get_draft_index
+
 class CreateDraftTweetTool(Tool):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
         # Extract content from parameters
@@ -21,6 +23,15 @@ class CreateDraftTweetTool(Tool):
             return
         
         try:
+            # Look for saved drafts with nearly the same content
+            draft_index = get_draft_index()
+            duplicates = draft_index.find(content)
+            
+            if duplicates and not tool_parameters.get("allow_duplicates"):
+                duplicate_id, similarity = duplicates[0]
+                yield self.create_error_message(f"Draft {duplicate_id} already has nearly the same content (similarity {similarity}). Set allow_duplicates to save it anyway")
+                return
+            
             # Create the draft tweet data
             draft = {
                 "content": content,
@@ -35,12 +46,18 @@ class CreateDraftTweetTool(Tool):
             with open(os.path.join("drafts", draft_id), "w") as f:
                 json.dump(draft, f, indent=2)
             
-            # Return success message
-            yield self.create_json_message({
+            draft_index.add(draft_id, content)
+            
+            result = {
                 "status": "success",
                 "draft_id": draft_id,
                 "message": f"Draft tweet created with ID: {draft_id}"
-            })
+            }
+            if duplicates:
+                result["similar_drafts"] = [{"draft_id": duplicate_id, "similarity": similarity} for duplicate_id, similarity in duplicates]
+            
+            # Return success message
+            yield self.create_json_message(result)
             
         except Exception as e:
             yield self.create_error_message(f"Error creating draft tweet: {str(e)}")
\ No newline at end of file
@@ -2,15 +2,24 @@ from collections.abc import Generator
 from typing import Any
 
 import requests
-from requests_oauthlib import OAuth1Session
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils.deadline import Deadline
+from utils.idempotency import idempotency_store
+from utils.similarity import posted_index
+from utils.transport import get_session
+
 class DeleteTweetTool(Tool):
+    DELETE_TIMEOUT = 30  # Delete request timeout (seconds)
+    
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
         """
         Delete a tweet using the X API
         """
+        # Every request below must finish before the invocation's deadline
+        deadline = Deadline.start()
+        
         # Extract tweet_id from parameters
         tweet_id = tool_parameters.get("tweet_id")
         
@@ -22,19 +31,14 @@ class DeleteTweetTool(Tool):
             # Get credentials from runtime
             credentials = self.runtime.credentials
             
-            # Create OAuth1 session
-            oauth = OAuth1Session(
-                credentials["api_key"],
-                client_secret=credentials["api_secret"],
-                resource_owner_key=credentials["access_token"],
-                resource_owner_secret=credentials["access_token_secret"]
-            )
+            # Get the account's pooled session (HTTP/1.1, or HTTP/2 if enabled for the provider)
+            oauth = get_session(credentials)
             
             # Endpoint URL for deleting tweets
             url = f"https://api.twitter.com/2/tweets/{tweet_id}"
             
             # Delete the tweet
-            response = oauth.delete(url)
+            response = oauth.delete(url, timeout=deadline.timeout(self.DELETE_TIMEOUT, "delete the tweet"))
             
             # Check if the request was successful
             if response.status_code == 200:
@@ -42,6 +46,10 @@ class DeleteTweetTool(Tool):
                 deleted = response_data.get("data", {}).get("deleted", False)
                 
                 if deleted:
+                    # Allow the same content to be posted again
+                    idempotency_store.discard_tweet(tweet_id)
+                    posted_index.remove(tweet_id)
+                    
                     # Return success message
                     yield self.create_json_message({
                         "status": "success",
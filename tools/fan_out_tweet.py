@@ -0,0 +1,275 @@
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+import os
+
+from requests_oauthlib import OAuth1Session
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+import tools.media_tweet as media_tweet
+from utils.deadline import Deadline
+from utils.idempotency import build_idempotency_key, hash_file, idempotency_store, uploaded_media_store
+from utils.profiles import ProfileStoreError, profile_store
+from utils.similarity import check_recent_posts, record_post
+from utils.transport import HTTP2Session, get_session
+
+class FanOutTweetTool(media_tweet.MediaTweetTool):
+    MAX_ACCOUNTS = 20  # Maximum number of accounts per invocation
+    MAX_WORKERS = 8  # Accounts posted to concurrently
+    
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        """
+        Post the same tweet, optionally with media, from several saved account profiles
+        """
+        # Every account's requests must finish before the invocation's deadline
+        deadline = Deadline.start()
+        
+        # Extract parameters
+        text = tool_parameters.get("text")
+        media_file = tool_parameters.get("media")
+        accounts = list(dict.fromkeys(
+            name.strip() for name in (tool_parameters.get("accounts") or "").split(",") if name.strip()
+        ))
+        
+        if not text:
+            yield self.create_text_message("Error: Tweet text is required")
+            return
+        
+        if len(text) > 280:
+            yield self.create_text_message("Error: Tweet text must be 280 characters or less")
+            return
+        
+        if not accounts:
+            yield self.create_text_message("Error: At least one account profile is required")
+            return
+        
+        if len(accounts) > self.MAX_ACCOUNTS:
+            yield self.create_text_message(f"Error: At most {self.MAX_ACCOUNTS} account profiles can be posted to at once")
+            return
+        
+        passphrase = self.runtime.credentials.get("profile_store_key")
+        if not passphrase:
+            yield self.create_text_message("Error: Profile Store Key is not configured for this provider")
+            return
+        
+        media_path = None
+        
+        try:
+            try:
+                profiles = profile_store.load(passphrase, accounts)
+            except ProfileStoreError as profile_error:
+                yield self.create_text_message(f"Error: {str(profile_error)}")
+                return
+            
+            # A caller-supplied key doesn't depend on the media, so a retry every account
+            # already posted is answered before downloading it
+            idempotency_key = tool_parameters.get("idempotency_key")
+            if idempotency_key:
+                previous_results = {
+                    name: idempotency_store.get(build_idempotency_key(profiles[name], text, idempotency_key=idempotency_key))
+                    for name in accounts
+                }
+                if all(previous_results.values()):
+                    results = [self._replayed_result(name, previous_results[name]) for name in accounts]
+                    media_type = next((result.get("media_type") for result in previous_results.values() if result.get("media_type")), None)
+                    yield self.create_json_message(self._summarize(text, media_type, results))
+                    return
+            
+            # Download and check the media once, then upload it to every account
+            media_type = None
+            media_hash = None
+            if media_file:
+                media_path, media_type = yield from self._prepare_media(media_file, deadline)
+                
+                if not media_path:
+                    return
+                
+                media_hash = hash_file(media_path)
+            
+            yield self.create_text_message(f"Posting to {len(accounts)} accounts...")
+            
+            # Profiles only hold credentials, so every account uses the provider's transport setting
+            http2 = self.runtime.credentials.get("http_transport") == "http2"
+            
+            with ThreadPoolExecutor(max_workers=min(len(accounts), self.MAX_WORKERS)) as executor:
+                futures = [
+                    executor.submit(
+                        self._post_for_account,
+                        name,
+                        profiles[name],
+                        text,
+                        media_path,
+                        media_type,
+                        media_hash,
+                        idempotency_key,
+                        bool(tool_parameters.get("allow_duplicates")),
+                        http2,
+                        deadline
+                    )
+                    for name in accounts
+                ]
+                results = [future.result() for future in futures]
+            
+            summary = self._summarize(text, media_type, results)
+            
+            # Show how each account's concurrent requests were multiplexed over its connections
+            transport = {}
+            for name in accounts:
+                session = get_session(profiles[name], http2=http2)
+                if isinstance(session, HTTP2Session):
+                    transport[name] = session.stats()
+            if transport:
+                summary["transport"] = transport
+            
+            yield self.create_json_message(summary)
+        
+        except Exception as e:
+            error_message = f"Error posting fan-out tweet: {str(e)}"
+            yield self.create_text_message(error_message)
+        finally:
+            # Clean up the temporary file
+            if media_path and os.path.exists(media_path):
+                os.unlink(media_path)
+    
+    def _post_for_account(self, name: str, credentials: dict[str, Any], text: str, media_path: str, media_type: str, media_hash: str, idempotency_key: str, allow_duplicates: bool, http2: bool, deadline: Deadline) -> dict[str, Any]:
+        """
+        Upload the media and post the tweet from one account
+        
+        Args:
+            name: Profile name
+            credentials: X API credentials of the account
+            text: Tweet text
+            media_path: Path to the prepared media file, or None
+            media_type: 'image' or 'video', or None
+            media_hash: SHA-256 of the media file, or None
+            idempotency_key: Key supplied by the caller, or None
+            allow_duplicates: Whether to post even if the account recently posted a near-duplicate
+            http2: Whether to use HTTP/2
+            deadline: Deadline of the invocation
+        
+        Returns:
+            Result of the post for this account
+        """
+        try:
+            # Accounts still waiting for a worker when time runs out are not started
+            deadline.check("post from this account")
+            
+            oauth = get_session(credentials, http2=http2)
+            
+            # Retries of the same post return the original result for this account
+            post_key = build_idempotency_key(credentials, text, media_hash=media_hash, idempotency_key=idempotency_key)
+            
+            with idempotency_store.key_lock(post_key, deadline):
+                previous_result = idempotency_store.get(post_key)
+                if previous_result:
+                    return self._replayed_result(name, previous_result)
+                
+                near_duplicates, duplicate_error = check_recent_posts(credentials, text, allow_duplicates)
+                
+                if duplicate_error:
+                    return {"account": name, "status": "failed", "error": duplicate_error}
+                
+                media_id = None
+                if media_path:
+                    # Media already uploaded to this account is attached again instead of re-uploaded
+                    media_key = build_idempotency_key(credentials, "", media_hash=media_hash)
+                    with uploaded_media_store.key_lock(media_key, deadline):
+                        uploaded = uploaded_media_store.get(media_key)
+                        if uploaded:
+                            media_id = uploaded["media_id"]
+                        else:
+                            media_id = self._upload_media(oauth, media_path, media_type == 'video', deadline)
+                            if not media_id:
+                                return {"account": name, "status": "failed", "error": "Failed to upload media"}
+                            uploaded_media_store.put(media_key, {"media_id": media_id})
+                    
+                    tweet_id = self._post_tweet_with_media(oauth, text, media_id, deadline)
+                else:
+                    tweet_id = self._post_tweet(oauth, text, deadline)
+                
+                if not tweet_id:
+                    return {"account": name, "status": "failed", "error": "Failed to post tweet"}
+                
+                result = {
+                    "account": name,
+                    "status": "success",
+                    "tweet_id": tweet_id,
+                    "media_id": media_id
+                }
+                if near_duplicates:
+                    result["near_duplicates"] = near_duplicates
+                record_post(credentials, tweet_id, text)
+                # Keep the media type so a full replay can report it without the media
+                idempotency_store.put(post_key, {**result, "media_type": media_type})
+                return result
+        
+        except Exception as e:
+            return {"account": name, "status": "failed", "error": str(e)}
+    
+    def _replayed_result(self, name: str, previous_result: dict[str, Any]) -> dict[str, Any]:
+        """
+        Get the result of an account from its stored earlier result
+        
+        The result may have been stored by Post Tweet or Post Media Tweet for the same account.
+        
+        Args:
+            name: Profile name
+            previous_result: Stored result of the earlier post
+        
+        Returns:
+            Result of the post for this account
+        """
+        return {
+            "account": name,
+            "status": "success",
+            "tweet_id": previous_result.get("tweet_id"),
+            "media_id": previous_result.get("media_id"),
+            "replayed": True
+        }
+    
+    def _summarize(self, text: str, media_type: str, results: list[dict[str, Any]]) -> dict[str, Any]:
+        """
+        Combine the results of every account
+        
+        Args:
+            text: Tweet text
+            media_type: 'image' or 'video', or None
+            results: Result of each account
+        
+        Returns:
+            JSON result of the invocation
+        """
+        succeeded = sum(1 for result in results if result["status"] == "success")
+        if succeeded == len(results):
+            status = "success"
+        elif succeeded:
+            status = "partial"
+        else:
+            status = "failed"
+        
+        return {
+            "status": status,
+            "text": text,
+            "media_type": media_type,
+            "results": results,
+            "message": f"Tweet published from {succeeded} of {len(results)} accounts"
+        }
+    
+    def _post_tweet(self, oauth: OAuth1Session, text: str, deadline: Deadline) -> str:
+        """
+        Post a text-only tweet
+        
+        Args:
+            oauth: OAuth1Session object
+            text: Tweet text
+            deadline: Deadline of the invocation
+        
+        Returns:
+            Tweet ID or None if posting failed
+        """
+        response = oauth.post('https://api.twitter.com/2/tweets', json={"text": text}, timeout=deadline.timeout(self.TWEET_TIMEOUT, "post the tweet"))
+        
+        if response.status_code != 201 and response.status_code != 200:
+            return None
+        
+        return response.json().get('data', {}).get('id')
@@ -0,0 +1,37 @@
+from collections.abc import Generator
+from typing import Any
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.jobs import job_queue
+
+class JobStatusTool(Tool):
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        """
+        Get the progress or result of a background job
+        """
+        # Extract job_id from parameters
+        job_id = tool_parameters.get("job_id")
+        
+        if not job_id:
+            yield self.create_text_message("Error: Job ID is required")
+            return
+        
+        try:
+            # Jobs are only visible to the account that queued them
+            job = job_queue.get(self.runtime.credentials, job_id)
+            
+            if not job:
+                yield self.create_text_message(f"Error: Job with ID {job_id} does not exist")
+                return
+            
+            yield self.create_json_message({
+                "status": "success",
+                **job,
+                "message": f"Job {job_id} is {job['job_status']}"
+            })
+            
+        except Exception as e:
+            error_message = f"Error getting job status: {str(e)}"
+            yield self.create_text_message(error_message)
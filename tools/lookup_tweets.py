@@ -0,0 +1,53 @@
+from collections.abc import Generator
+from typing import Any
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.deadline import Deadline
+from utils.lookup import tweet_lookup_service
+
+class LookupTweetsTool(Tool):
+    MAX_TWEET_IDS = 100  # Maximum number of tweets per invocation
+    
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        """
+        Look up the status and public metrics of tweets using the X API
+        """
+        # Waiting for the lookup must end before the invocation's deadline
+        deadline = Deadline.start()
+        
+        # Extract tweet IDs from parameters, keeping their order without duplicates
+        tweet_ids = list(dict.fromkeys(
+            tweet_id.strip() for tweet_id in (tool_parameters.get("tweet_ids") or "").split(",") if tweet_id.strip()
+        ))
+        
+        if not tweet_ids:
+            yield self.create_text_message("Error: At least one tweet ID is required")
+            return
+        
+        if len(tweet_ids) > self.MAX_TWEET_IDS:
+            yield self.create_text_message(f"Error: At most {self.MAX_TWEET_IDS} tweet IDs can be looked up at once")
+            return
+        
+        invalid_ids = [tweet_id for tweet_id in tweet_ids if not tweet_id.isdigit()]
+        if invalid_ids:
+            yield self.create_text_message(f"Error: Invalid tweet IDs: {', '.join(invalid_ids)}")
+            return
+        
+        try:
+            # Lookups from concurrent invocations are batched into shared requests
+            tweets = tweet_lookup_service.lookup(self.runtime.credentials, tweet_ids, deadline)
+            
+            results = [{"id": tweet_id, **tweets[tweet_id]} for tweet_id in tweet_ids]
+            found = sum(1 for result in results if "error" not in result)
+            
+            yield self.create_json_message({
+                "status": "success",
+                "tweets": results,
+                "message": f"Found {found} of {len(results)} tweets"
+            })
+            
+        except Exception as e:
+            error_message = f"Error looking up tweets: {str(e)}"
+            yield self.create_text_message(error_message)
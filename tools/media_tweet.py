@@ -1,6 +1,8 @@
 from collections.abc import Generator
 from typing import Any
 import os
+import shutil
+import ssl
 import tempfile
 import time
 import mimetypes
@@ -12,6 +14,14 @@ import json
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.download import ranged_downloader
+from utils.idempotency import build_idempotency_key, hash_file, idempotency_store
+from utils.jobs import job_queue
+from utils.mp4 import UnsupportedContainerError, normalize_mp4
+from utils.similarity import check_recent_posts, record_post
+from utils.transport import get_session
+
 class MediaTweetTool(Tool):
     # Set longer timeout values, especially for video uploads
     DOWNLOAD_TIMEOUT = 60  # Download media timeout (seconds)
@@ -21,6 +31,12 @@ class MediaTweetTool(Tool):
     STATUS_TIMEOUT = 30  # Check status timeout (seconds)
     TWEET_TIMEOUT = 30  # Send tweet timeout (seconds)
     
+    # Shares of the remaining time, so later phases aren't starved by earlier ones
+    DOWNLOAD_SHARE = 0.5  # All download attempts together
+    UPLOAD_SHARE = 0.75  # Each upload request
+    CONTROL_SHARE = 0.5  # Initialize, finalize and each status check
+    POST_UPLOAD_RESERVE = 20  # Time kept after a video upload for finalize, processing checks and the tweet (seconds)
+    
     # Supported media formats
     SUPPORTED_IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
     SUPPORTED_VIDEO_EXTENSIONS = ['.mp4', '.mov', '.avi', '.wmv']
@@ -29,6 +45,9 @@ class MediaTweetTool(Tool):
         """
         Post a tweet with media (image or video) using X API
         """
+        # Every request below must finish before the invocation's deadline
+        deadline = Deadline.start()
+        
         # Extract parameters
         text = tool_parameters.get("text")
         media_file = tool_parameters.get("media")
@@ -51,167 +70,110 @@ class MediaTweetTool(Tool):
             # Get credentials from runtime
             credentials = self.runtime.credentials
             
-            # Create OAuth1 session
-            oauth = OAuth1Session(
-                credentials["api_key"],
-                client_secret=credentials["api_secret"],
-                resource_owner_key=credentials["access_token"],
-                resource_owner_secret=credentials["access_token_secret"]
-            )
+            # Hand the work to the background queue and return the job ID immediately
+            if tool_parameters.get("run_in_background"):
+                # The media is fetched now, while Dify's file URL is still valid, and the job gets its local path
+                job_parameters = {**tool_parameters, "run_in_background": False, "media": None}
+                job_id = job_queue.submit(
+                    credentials,
+                    "media_tweet",
+                    type(self),
+                    job_parameters,
+                    fetch=lambda job_directory: self._fetch_job_media(media_file, job_directory)
+                )
+                yield self.create_json_message({
+                    "status": "queued",
+                    "job_id": job_id,
+                    "message": f"Media tweet queued as job {job_id}. Use the Job Status tool to check its progress."
+                })
+                return
             
-            # Check Dify provided media parameter format
-            if isinstance(media_file, dict):
-                # Get media information from Dify dictionary format
-                media_url = media_file.get('url')
-                file_extension = media_file.get('extension', '')
-                mime_type = media_file.get('mime_type', '')
-                filename = media_file.get('filename', 'media')
-                
-                # If URL exists, download media file through URL
-                if media_url:
-                    yield self.create_text_message(f"Downloading media file from URL...")
-                    
-                    # Try different timeout settings and disable SSL verification
-                    try:
-                        # First try using requests instead of httpx, as requests may be more stable in some network environments
-                        media_path = self._download_media_from_url_with_requests(
-                            media_url, 
-                            file_extension, 
-                            self.DOWNLOAD_TIMEOUT,
-                            verify_ssl=False
-                        )
-                        
-                        if not media_path:
-                            # If first attempt fails, try enabling SSL verification
-                            yield self.create_text_message("First download attempt failed, retrying with different configuration...")
-                            media_path = self._download_media_from_url_with_requests(
-                                media_url, 
-                                file_extension, 
-                                self.DOWNLOAD_TIMEOUT, 
-                                verify_ssl=True
-                            )
-                            
-                        if not media_path:
-                            # If still fails, try using httpx instead of requests
-                            media_path = self._download_media_from_url_with_httpx(
-                                media_url, 
-                                file_extension, 
-                                self.DOWNLOAD_TIMEOUT * 2  # Use longer timeout
-                            )
-                    except Exception as download_error:
-                        yield self.create_text_message(f"Error downloading media: {str(download_error)}")
-                        return
-                        
-                    if not media_path:
-                        yield self.create_text_message("Error: Failed to download media from URL after multiple attempts")
-                        return
-                else:
-                    yield self.create_text_message("Error: No media URL provided")
-                    return
-            else:
-                # Process directly uploaded file (blob format)
-                try:
-                    if hasattr(media_file, 'blob'):
-                        file_extension = os.path.splitext(media_file.filename)[1].lower() if hasattr(media_file, 'filename') and media_file.filename else ''
-                        if not file_extension:
-                            # Try to determine extension from mimetype
-                            if hasattr(media_file, 'mimetype') and media_file.mimetype:
-                                ext = mimetypes.guess_extension(media_file.mimetype)
-                                if ext:
-                                    file_extension = ext.lower()
-                            else:
-                                file_extension = '.tmp'
-                        
-                        # Write blob to temporary file
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-                            try:
-                                # Try to access blob attribute directly, may cause HTTPS request
-                                blob_data = media_file.blob
-                                temp_file.write(blob_data)
-                                media_path = temp_file.name
-                            except Exception as blob_err:
-                                # If blob attribute access fails, try checking if there's a URL attribute
-                                if hasattr(media_file, 'url') and media_file.url:
-                                    # Close temporary file and clean up
-                                    temp_file.close()
-                                    os.unlink(temp_file.name)
-                                    
-                                    # Use URL download as alternative
-                                    media_path = self._download_media_from_url_with_requests(
-                                        media_file.url,
-                                        file_extension,
-                                        self.DOWNLOAD_TIMEOUT * 2,
-                                        verify_ssl=False
-                                    )
-                                else:
-                                    # If no URL attribute, re-raise exception
-                                    raise
-                    else:
-                        yield self.create_text_message("Error: Invalid media file format")
-                        return
-                except Exception as e:
-                    yield self.create_text_message(f"Error processing media file: {str(e)}")
+            # A caller-supplied key doesn't depend on the media, so a retry is answered before downloading it
+            if tool_parameters.get("idempotency_key"):
+                previous_result = idempotency_store.get(build_idempotency_key(credentials, text, idempotency_key=tool_parameters.get("idempotency_key")))
+                if previous_result:
+                    previous_result["replayed"] = True
+                    yield self.create_json_message(previous_result)
                     return
             
+            # Get the account's pooled session (HTTP/1.1, or HTTP/2 if enabled for the provider)
+            oauth = get_session(credentials)
+            
+            media_path, media_type = yield from self._prepare_media(media_file, deadline)
+            
             if not media_path:
-                yield self.create_text_message("Error: Failed to prepare media file")
                 return
-                
+            
             try:
-                # Validate media file type
-                
-                # Check if file exists and is readable
-                if not os.path.exists(media_path):
-                    yield self.create_text_message("Error: Media file does not exist")
-                    return
-                    
-                file_size = os.path.getsize(media_path)
-                
-                if file_size == 0:
-                    yield self.create_text_message("Error: Media file is empty")
-                    return
-                    
-                media_type = self._validate_media_type(media_path, file_extension)
-                
-                if not media_type:
-                    yield self.create_text_message("Error: Unsupported media format. Please upload JPG, PNG, GIF, WEBP for images or MP4 for videos.")
-                    return
-                    
                 # Determine media type (image or video)
                 is_video = media_type == 'video'
                 
-                # Inform user that media upload may take some time
-                if is_video:
-                    yield self.create_text_message("Uploading video file to X, this may take some time...")
-                else:
-                    yield self.create_text_message(f"Uploading {media_type} to X...")
+                # Retries of the same post (same text and media content) return the original result
+                idempotency_key = build_idempotency_key(
+                    credentials,
+                    text,
+                    media_hash=hash_file(media_path),
+                    idempotency_key=tool_parameters.get("idempotency_key")
+                )
                 
-                # Upload the media to Twitter
-                media_id = self._upload_media(oauth, media_path, is_video)
-                
-                if media_id:
-                    # Post the tweet with media
-                    tweet_id = self._post_tweet_with_media(oauth, text, media_id)
+                # Hold the key lock so a concurrent retry waits for this attempt instead of uploading again
+                with idempotency_store.key_lock(idempotency_key, deadline):
+                    previous_result = idempotency_store.get(idempotency_key)
+                    if previous_result:
+                        previous_result["replayed"] = True
+                        yield self.create_json_message(previous_result)
+                        return
+                    
+                    # Checked before uploading, so a rejected post doesn't upload the media
+                    near_duplicates, duplicate_error = check_recent_posts(credentials, text, tool_parameters.get("allow_duplicates"))
                     
-                    if tweet_id:
-                        # Return success message with tweet ID
-                        yield self.create_json_message({
-                            "status": "success",
-                            "tweet_id": tweet_id,
-                            "text": text,
-                            "media_id": media_id,
-                            "media_type": media_type,
-                            "message": f"Tweet with {media_type} published successfully with ID: {tweet_id}"
-                        })
+                    if duplicate_error:
+                        yield self.create_text_message(f"Error: {duplicate_error}")
+                        return
+                    
+                    # Inform user that media upload may take some time
+                    if is_video:
+                        yield self.create_text_message("Uploading video file to X, this may take some time...")
                     else:
+                        yield self.create_text_message(f"Uploading {media_type} to X...")
+                    
+                    # Upload the media to Twitter
+                    media_id = self._upload_media(oauth, media_path, is_video, deadline)
+                    
+                    if not media_id:
+                        yield self.create_text_message("Error: Failed to upload media")
+                        return
+                    
+                    # Post the tweet with media
+                    tweet_id = self._post_tweet_with_media(oauth, text, media_id, deadline)
+                    
+                    if not tweet_id:
                         yield self.create_text_message("Error: Failed to post tweet with media")
-                else:
-                    yield self.create_text_message("Error: Failed to upload media")
+                        return
+                    
+                    result = {
+                        "status": "success",
+                        "tweet_id": tweet_id,
+                        "text": text,
+                        "media_id": media_id,
+                        "media_type": media_type,
+                        "message": f"Tweet with {media_type} published successfully with ID: {tweet_id}"
+                    }
+                    if near_duplicates:
+                        result["near_duplicates"] = near_duplicates
+                    record_post(credentials, tweet_id, text)
+                    idempotency_store.put(idempotency_key, result)
+                
+                # Return success message with tweet ID
+                yield self.create_json_message(result)
             finally:
                 # Clean up the temporary file
                 if media_path and os.path.exists(media_path):
                     os.unlink(media_path)
                 
+        except DeadlineExceeded as deadline_err:
+            error_message = f"Error: {str(deadline_err)}. Large videos can be posted with run_in_background enabled."
+            yield self.create_text_message(error_message)
         except requests.exceptions.Timeout as timeout_err:
             error_message = "Error: Request timed out. The media file may be too large or your network connection is slow."
             yield self.create_text_message(error_message)
@@ -222,40 +184,227 @@ class MediaTweetTool(Tool):
             error_message = f"Error posting media tweet: {str(e)}"
             yield self.create_text_message(error_message)
     
-    def _download_media_from_url_with_requests(self, url: str, file_extension: str, timeout: int, verify_ssl: bool = True) -> str:
+    def _fetch_job_media(self, media_file: Any, job_directory: str) -> dict[str, Any]:
+        """
+        Fetch and check the media of a background job into its directory
+        
+        Args:
+            media_file: Media parameter provided by Dify
+            job_directory: Directory of the job
+            
+        Returns:
+            Job parameters pointing at the fetched media
+            
+        Raises:
+            RuntimeError: If the media can't be posted
+        """
+        preparation = self._prepare_media(media_file, Deadline.start())
+        last_text = None
+        try:
+            while True:
+                last_text = next(preparation).message.text
+        except StopIteration as done:
+            media_path, _ = done.value
+        
+        if not media_path:
+            raise RuntimeError(last_text or "Failed to prepare media file")
+        
+        job_media_path = os.path.join(job_directory, "media" + os.path.splitext(media_path)[1])
+        shutil.move(media_path, job_media_path)
+        return {"media": job_media_path}
+    
+    def _prepare_media(self, media_file: Any, deadline: Deadline) -> Generator[ToolInvokeMessage, None, tuple[str, str]]:
+        """
+        Write the media file to a temporary file and check it can be posted
+        
+        Progress and error messages are yielded to the caller.
+        
+        Args:
+            media_file: Media parameter provided by Dify
+            deadline: Deadline of the invocation
+            
+        Returns:
+            Tuple of (temporary file path, 'image' or 'video'), or (None, None) if the media can't be posted
+        """
+        media_path = None
+        
+        # Download attempts share one part of the budget, leaving the rest for the upload
+        download_deadline = deadline.phase(self.DOWNLOAD_SHARE)
+        
+        # Check Dify provided media parameter format
+        if isinstance(media_file, dict):
+            # Get media information from Dify dictionary format
+            media_url = media_file.get('url')
+            file_extension = media_file.get('extension', '')
+            mime_type = media_file.get('mime_type', '')
+            filename = media_file.get('filename', 'media')
+            
+            # If URL exists, download media file through URL
+            if media_url:
+                yield self.create_text_message(f"Downloading media file from URL...")
+                
+                # Try different timeout settings and disable SSL verification
+                try:
+                    # First try using requests instead of httpx, as requests may be more stable in some network environments
+                    media_path = self._download_media_from_url_with_requests(
+                        media_url, 
+                        file_extension, 
+                        self.DOWNLOAD_TIMEOUT,
+                        download_deadline,
+                        verify_ssl=False
+                    )
+                    
+                    if not media_path:
+                        # If first attempt fails, try enabling SSL verification
+                        yield self.create_text_message("First download attempt failed, retrying with different configuration...")
+                        media_path = self._download_media_from_url_with_requests(
+                            media_url, 
+                            file_extension, 
+                            self.DOWNLOAD_TIMEOUT, 
+                            download_deadline,
+                            verify_ssl=True
+                        )
+                        
+                    if not media_path:
+                        # If still fails, try using httpx instead of requests
+                        media_path = self._download_media_from_url_with_httpx(
+                            media_url, 
+                            file_extension, 
+                            self.DOWNLOAD_TIMEOUT,
+                            download_deadline
+                        )
+                except Exception as download_error:
+                    yield self.create_text_message(f"Error downloading media: {str(download_error)}")
+                    return None, None
+                    
+                if not media_path:
+                    if not download_deadline.remaining():
+                        yield self.create_text_message("Error: Media download did not finish in time")
+                    else:
+                        yield self.create_text_message("Error: Failed to download media from URL after multiple attempts")
+                    return None, None
+            else:
+                yield self.create_text_message("Error: No media URL provided")
+                return None, None
+        elif isinstance(media_file, str):
+            # Media fetched when a background job was queued
+            media_path = media_file
+            file_extension = os.path.splitext(media_file)[1].lower()
+        else:
+            # Process directly uploaded file (blob format)
+            try:
+                if hasattr(media_file, 'blob'):
+                    file_extension = os.path.splitext(media_file.filename)[1].lower() if hasattr(media_file, 'filename') and media_file.filename else ''
+                    if not file_extension:
+                        # Try to determine extension from mimetype
+                        if hasattr(media_file, 'mimetype') and media_file.mimetype:
+                            ext = mimetypes.guess_extension(media_file.mimetype)
+                            if ext:
+                                file_extension = ext.lower()
+                        else:
+                            file_extension = '.tmp'
+                    
+                    # Write blob to temporary file
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
+                        try:
+                            # Try to access blob attribute directly, may cause HTTPS request
+                            blob_data = media_file.blob
+                            temp_file.write(blob_data)
+                            media_path = temp_file.name
+                        except Exception as blob_err:
+                            # If blob attribute access fails, try checking if there's a URL attribute
+                            if hasattr(media_file, 'url') and media_file.url:
+                                # Close temporary file and clean up
+                                temp_file.close()
+                                os.unlink(temp_file.name)
+                                
+                                # Use URL download as alternative
+                                media_path = self._download_media_from_url_with_requests(
+                                    media_file.url,
+                                    file_extension,
+                                    self.DOWNLOAD_TIMEOUT,
+                                    download_deadline,
+                                    verify_ssl=False
+                                )
+                            else:
+                                # If no URL attribute, re-raise exception
+                                raise
+                else:
+                    yield self.create_text_message("Error: Invalid media file format")
+                    return None, None
+            except Exception as e:
+                yield self.create_text_message(f"Error processing media file: {str(e)}")
+                return None, None
+        
+        if not media_path:
+            yield self.create_text_message("Error: Failed to prepare media file")
+            return None, None
+            
+        prepared = False
+        
+        try:
+            # Validate media file type
+            
+            # Check if file exists and is readable
+            if not os.path.exists(media_path):
+                yield self.create_text_message("Error: Media file does not exist")
+                return None, None
+                
+            file_size = os.path.getsize(media_path)
+            
+            if file_size == 0:
+                yield self.create_text_message("Error: Media file is empty")
+                return None, None
+                
+            media_type = self._validate_media_type(media_path, file_extension)
+            
+            if not media_type:
+                yield self.create_text_message("Error: Unsupported media format. Please upload JPG, PNG, GIF, WEBP for images or MP4 for videos.")
+                return None, None
+                
+            # Determine media type (image or video)
+            is_video = media_type == 'video'
+            
+            if is_video:
+                # Put the moov atom first and remux MOV to MP4 so X can start processing sooner
+                try:
+                    normalized_path = normalize_mp4(media_path)
+                except UnsupportedContainerError as container_error:
+                    yield self.create_text_message(f"Error: {str(container_error)}")
+                    return None, None
+                
+                if normalized_path != media_path:
+                    os.unlink(media_path)
+                    media_path = normalized_path
+            
+            prepared = True
+            return media_path, media_type
+        finally:
+            # Clean up the temporary file if the media can't be posted
+            if not prepared and media_path and os.path.exists(media_path):
+                os.unlink(media_path)
+    
+    def _download_media_from_url_with_requests(self, url: str, file_extension: str, timeout: int, deadline: Deadline, verify_ssl: bool = True) -> str:
         """
         Download media file from URL to temporary file using requests library
         
+        Large files are fetched in parallel byte ranges when the server supports
+        them, retrying failed ranges on their own. Otherwise the file is
+        downloaded in a single stream.
+        
         Args:
             url: Media file URL
             file_extension: File extension
             timeout: Download timeout (seconds)
+            deadline: Deadline of the download
             verify_ssl: Whether to verify SSL certificate
             
         Returns:
             Temporary file path
         """
-        try:
-            # Download file with specified timeout, optionally disable SSL verification
-            response = requests.get(url, stream=True, timeout=timeout, verify=verify_ssl)
+        return ranged_downloader.download(url, file_extension, timeout, verify_ssl=verify_ssl, deadline=deadline)
             
-            response.raise_for_status()  # Raise exception if request fails
-            
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-                # Write in chunks to handle large files
-                bytes_downloaded = 0
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        temp_file.write(chunk)
-                        bytes_downloaded += len(chunk)
-                
-                return temp_file.name
-                
-        except Exception:
-            return None
-            
-    def _download_media_from_url_with_httpx(self, url: str, file_extension: str, timeout: int) -> str:
+    def _download_media_from_url_with_httpx(self, url: str, file_extension: str, timeout: int, deadline: Deadline) -> str:
         """
         Download media file from URL to temporary file using httpx library
         
@@ -263,10 +412,13 @@ class MediaTweetTool(Tool):
             url: Media file URL
             file_extension: File extension
             timeout: Download timeout (seconds)
+            deadline: Deadline of the download
             
         Returns:
             Temporary file path
         """
+        temp_path = None
+        
         try:
             # Create custom SSL context, disable hostname verification
             ssl_context = ssl.create_default_context()
@@ -277,22 +429,29 @@ class MediaTweetTool(Tool):
             
             # Disable proxy
             client = httpx.Client(
-                timeout=timeout,
+                timeout=deadline.timeout(timeout, "download the media"),
                 verify=False,  # Disable SSL verification
-                proxies=None,  # Disable proxy
+                trust_env=False,  # Disable proxy
                 http2=False    # Disable HTTP/2, which sometimes causes TLS issues
             )
             
-            response = client.get(url)
-            response.raise_for_status()
-            
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-                # Write to file
-                temp_file.write(response.content)
-                return temp_file.name
+            with client.stream('GET', url) as response:
+                response.raise_for_status()
+                
+                # Create temporary file
+                with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
+                    temp_path = temp_file.name
+                    
+                    # Write to file, stopping once the deadline has passed
+                    for chunk in response.iter_bytes():
+                        temp_file.write(chunk)
+                        if not deadline.remaining():
+                            raise DeadlineExceeded("Media download did not finish in time")
+                    return temp_path
                 
         except Exception:
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
             return None
         finally:
             # Ensure httpx client is closed
@@ -339,17 +498,24 @@ class MediaTweetTool(Tool):
                 
         return None
     
-    def _upload_media(self, oauth: OAuth1Session, media_path: str, is_video: bool) -> str:
+    def _upload_media(self, oauth: OAuth1Session, media_path: str, is_video: bool, deadline: Deadline) -> str:
         """
         Upload media to Twitter
         
+        The upload is abandoned as soon as the measured upload speed shows the
+        rest of the file can't be sent before the deadline.
+        
         Args:
             oauth: OAuth1Session object
             media_path: Path to the media file
             is_video: Whether the media is a video
+            deadline: Deadline of the invocation
             
         Returns:
             Media ID or None if upload failed
+        
+        Raises:
+            DeadlineExceeded: If the upload can't finish in time
         """
         MEDIA_ENDPOINT_URL = 'https://upload.twitter.com/1.1/media/upload.json'
         
@@ -365,7 +531,7 @@ class MediaTweetTool(Tool):
                 'media_category': 'tweet_video'
             }
             
-            init_response = oauth.post(MEDIA_ENDPOINT_URL, data=init_params, timeout=self.INIT_TIMEOUT)
+            init_response = oauth.post(MEDIA_ENDPOINT_URL, data=init_params, timeout=deadline.timeout(self.INIT_TIMEOUT, "initialize the upload", self.CONTROL_SHARE))
             
             if init_response.status_code != 202 and init_response.status_code != 200:
                 return None
@@ -375,6 +541,7 @@ class MediaTweetTool(Tool):
             # APPEND
             segment_index = 0
             bytes_sent = 0
+            upload_started = time.monotonic()
             
             with open(media_path, 'rb') as video:
                 while bytes_sent < file_size:
@@ -390,13 +557,20 @@ class MediaTweetTool(Tool):
                         'media': chunk
                     }
                     
-                    append_response = oauth.post(MEDIA_ENDPOINT_URL, data=append_params, files=files, timeout=self.UPLOAD_TIMEOUT)
+                    append_response = oauth.post(MEDIA_ENDPOINT_URL, data=append_params, files=files, timeout=deadline.timeout(self.UPLOAD_TIMEOUT, "upload the video", self.UPLOAD_SHARE))
                     
                     if append_response.status_code != 204 and append_response.status_code != 200:
                         return None
                     
                     segment_index += 1
                     bytes_sent = video.tell()
+                    
+                    # Stop now rather than after the deadline if the rest can't be sent with time left to post
+                    if bytes_sent < file_size:
+                        seconds_left = (file_size - bytes_sent) * (time.monotonic() - upload_started) / bytes_sent
+                        upload_time = deadline.remaining() - self.POST_UPLOAD_RESERVE
+                        if seconds_left > upload_time:
+                            raise DeadlineExceeded(f"Video upload can't finish in time (about {int(seconds_left)}s of upload left, {max(0, int(upload_time))}s available)")
             
             # FINALIZE
             finalize_params = {
@@ -404,7 +578,7 @@ class MediaTweetTool(Tool):
                 'media_id': media_id
             }
             
-            finalize_response = oauth.post(MEDIA_ENDPOINT_URL, data=finalize_params, timeout=self.FINALIZE_TIMEOUT)
+            finalize_response = oauth.post(MEDIA_ENDPOINT_URL, data=finalize_params, timeout=deadline.timeout(self.FINALIZE_TIMEOUT, "finalize the upload", self.CONTROL_SHARE))
             
             if finalize_response.status_code != 201 and finalize_response.status_code != 200:
                 return None
@@ -413,7 +587,7 @@ class MediaTweetTool(Tool):
             
             # Check status if processing is needed
             if processing_info:
-                self._check_processing_status(oauth, media_id, processing_info)
+                self._check_processing_status(oauth, media_id, processing_info, deadline)
             
             return media_id
         else:
@@ -442,7 +616,7 @@ class MediaTweetTool(Tool):
                 else:
                     params = {'media_category': 'tweet_image'}
                 
-                response = oauth.post(MEDIA_ENDPOINT_URL, files=files, params=params, timeout=self.UPLOAD_TIMEOUT)
+                response = oauth.post(MEDIA_ENDPOINT_URL, files=files, params=params, timeout=deadline.timeout(self.UPLOAD_TIMEOUT, "upload the image", self.UPLOAD_SHARE))
                 
                 if response.status_code != 200:
                     return None
@@ -450,7 +624,7 @@ class MediaTweetTool(Tool):
                 media_id = response.json().get('media_id_string')
                 return media_id
     
-    def _check_processing_status(self, oauth: OAuth1Session, media_id: str, processing_info: dict) -> None:
+    def _check_processing_status(self, oauth: OAuth1Session, media_id: str, processing_info: dict, deadline: Deadline) -> None:
         """
         Check the processing status of a media upload
         
@@ -458,6 +632,10 @@ class MediaTweetTool(Tool):
             oauth: OAuth1Session object
             media_id: Media ID
             processing_info: Processing info dict
+            deadline: Deadline of the invocation
+        
+        Raises:
+            DeadlineExceeded: If processing can't be waited for before the deadline
         """
         MEDIA_ENDPOINT_URL = 'https://upload.twitter.com/1.1/media/upload.json'
         
@@ -470,6 +648,10 @@ class MediaTweetTool(Tool):
             return
         
         check_after_secs = processing_info.get('check_after_secs', 5)
+        
+        # Don't sleep past the deadline only to find there's no time left to post
+        if check_after_secs >= deadline.remaining():
+            raise DeadlineExceeded("X did not finish processing the video in time")
         time.sleep(check_after_secs)
         
         params = {
@@ -477,7 +659,7 @@ class MediaTweetTool(Tool):
             'media_id': media_id
         }
         
-        response = oauth.get(MEDIA_ENDPOINT_URL, params=params, timeout=self.STATUS_TIMEOUT)
+        response = oauth.get(MEDIA_ENDPOINT_URL, params=params, timeout=deadline.timeout(self.STATUS_TIMEOUT, "check the processing status", self.CONTROL_SHARE))
         
         if response.status_code != 200:
             return
@@ -485,9 +667,9 @@ class MediaTweetTool(Tool):
         processing_info = response.json().get('processing_info')
         
         if processing_info:
-            self._check_processing_status(oauth, media_id, processing_info)
+            self._check_processing_status(oauth, media_id, processing_info, deadline)
     
-    def _post_tweet_with_media(self, oauth: OAuth1Session, text: str, media_id: str) -> str:
+    def _post_tweet_with_media(self, oauth: OAuth1Session, text: str, media_id: str, deadline: Deadline) -> str:
         """
         Post a tweet with media
         
@@ -495,6 +677,7 @@ class MediaTweetTool(Tool):
             oauth: OAuth1Session object
             text: Tweet text
             media_id: Media ID
+            deadline: Deadline of the invocation
             
         Returns:
             Tweet ID or None if posting failed
@@ -508,7 +691,7 @@ class MediaTweetTool(Tool):
             }
         }
         
-        response = oauth.post(POST_TWEET_URL, json=payload, timeout=self.TWEET_TIMEOUT)
+        response = oauth.post(POST_TWEET_URL, json=payload, timeout=deadline.timeout(self.TWEET_TIMEOUT, "post the tweet"))
         
         if response.status_code != 201 and response.status_code != 200:
             return None
@@ -2,16 +2,26 @@ from collections.abc import Generator
 from typing import Any
 
 import requests
-from requests_oauthlib import OAuth1Session
 import json
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils.deadline import Deadline
+from utils.idempotency import build_idempotency_key, idempotency_store
+from utils.jobs import job_queue
+from utils.similarity import check_recent_posts, record_post
+from utils.transport import get_session
+
 class PostTweetTool(Tool):
+    TWEET_TIMEOUT = 30  # Tweet request timeout (seconds)
+    
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
         """
         Post a tweet using the X API
         """
+        # Every request below must finish before the invocation's deadline
+        deadline = Deadline.start()
+        
         # Extract text from parameters
         text = tool_parameters.get("text")
         
@@ -27,44 +37,88 @@ class PostTweetTool(Tool):
             # Get credentials from runtime
             credentials = self.runtime.credentials
             
-            # Create OAuth1 session
-            oauth = OAuth1Session(
-                credentials["api_key"],
-                client_secret=credentials["api_secret"],
-                resource_owner_key=credentials["access_token"],
-                resource_owner_secret=credentials["access_token_secret"]
-            )
-            
-            # Endpoint URL for posting tweets
-            url = "https://api.twitter.com/2/tweets"
+            # Hand the work to the background queue and return the job ID immediately
+            if tool_parameters.get("run_in_background"):
+                job_parameters = {**tool_parameters, "run_in_background": False}
+                job_id = job_queue.submit(credentials, "post_tweet", type(self), job_parameters)
+                yield self.create_json_message({
+                    "status": "queued",
+                    "job_id": job_id,
+                    "message": f"Tweet queued as job {job_id}. Use the Job Status tool to check its progress."
+                })
+                return
             
-            # Request payload
-            payload = {
-                "text": text
-            }
+            # Requests with the same key (retries of the same post) return the original result
+            idempotency_key = build_idempotency_key(credentials, text, idempotency_key=tool_parameters.get("idempotency_key"))
             
-            # Post the tweet
-            response = oauth.post(
-                url,
-                json=payload
-            )
+            # Hold the key lock so a concurrent retry waits for this attempt instead of posting again
+            with idempotency_store.key_lock(idempotency_key, deadline):
+                result = idempotency_store.get(idempotency_key)
+                if result:
+                    result["replayed"] = True
+                else:
+                    near_duplicates, duplicate_error = check_recent_posts(credentials, text, tool_parameters.get("allow_duplicates"))
+                    
+                    if duplicate_error:
+                        error_message = f"Error: {duplicate_error}"
+                    else:
+                        result, error_message = self._post_tweet(credentials, text, deadline)
+                        if result:
+                            if near_duplicates:
+                                result["near_duplicates"] = near_duplicates
+                            record_post(credentials, result["tweet_id"], text)
+                            idempotency_store.put(idempotency_key, result)
             
-            # Check if the request was successful
-            if response.status_code in [200, 201]:
-                response_data = response.json()
-                tweet_id = response_data.get("data", {}).get("id")
-                
+            if result:
                 # Return success message with tweet ID
-                yield self.create_json_message({
-                    "status": "success",
-                    "tweet_id": tweet_id,
-                    "text": text,
-                    "message": f"Tweet published successfully with ID: {tweet_id}"
-                })
+                yield self.create_json_message(result)
             else:
-                error_message = f"Failed to post tweet. Status code: {response.status_code}, Response: {response.text}"
                 yield self.create_text_message(error_message)
                 
         except Exception as e:
             error_message = f"Error posting tweet: {str(e)}"
-            yield self.create_text_message(error_message)
\ No newline at end of file
+            yield self.create_text_message(error_message)
+    
+    def _post_tweet(self, credentials: dict[str, Any], text: str, deadline: Deadline) -> tuple[dict[str, Any], str]:
+        """
+        Post the tweet to X
+        
+        Args:
+            credentials: Provider credentials
+            text: Tweet text
+            deadline: Deadline of the invocation
+            
+        Returns:
+            Tuple of (result, None) on success or (None, error message) on failure
+        """
+        # Get the account's pooled session (HTTP/1.1, or HTTP/2 if enabled for the provider)
+        oauth = get_session(credentials)
+        
+        # Endpoint URL for posting tweets
+        url = "https://api.twitter.com/2/tweets"
+        
+        # Request payload
+        payload = {
+            "text": text
+        }
+        
+        # Post the tweet
+        response = oauth.post(
+            url,
+            json=payload,
+            timeout=deadline.timeout(self.TWEET_TIMEOUT, "post the tweet")
+        )
+        
+        # Check if the request was successful
+        if response.status_code in [200, 201]:
+            response_data = response.json()
+            tweet_id = response_data.get("data", {}).get("id")
+            
+            return {
+                "status": "success",
+                "tweet_id": tweet_id,
+                "text": text,
+                "message": f"Tweet published successfully with ID: {tweet_id}"
+            }, None
+        
+        return None, f"Failed to post tweet. Status code: {response.status_code}, Response: {response.text}"
\ No newline at end of file
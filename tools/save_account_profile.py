@@ -0,0 +1,47 @@
+from collections.abc import Generator
+from typing import Any
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.profiles import ProfileStoreError, profile_store
+
+class SaveAccountProfileTool(Tool):
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        """
+        Save the provider's current X credentials as a named account profile
+        """
+        # Extract name from parameters
+        name = (tool_parameters.get("name") or "").strip()
+        
+        if not name:
+            yield self.create_text_message("Error: Profile name is required")
+            return
+        
+        if "," in name:
+            yield self.create_text_message("Error: Profile name must not contain commas")
+            return
+        
+        try:
+            # Get credentials from runtime
+            credentials = self.runtime.credentials
+            
+            passphrase = credentials.get("profile_store_key")
+            if not passphrase:
+                yield self.create_text_message("Error: Profile Store Key is not configured for this provider")
+                return
+            
+            profile_store.save(passphrase, name, credentials)
+            
+            yield self.create_json_message({
+                "status": "success",
+                "name": name,
+                "profiles": profile_store.names(passphrase),
+                "message": f"Account profile {name} saved successfully"
+            })
+            
+        except ProfileStoreError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+        except Exception as e:
+            error_message = f"Error saving account profile: {str(e)}"
+            yield self.create_text_message(error_message)
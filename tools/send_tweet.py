@@ -7,8 +7,13 @@ import tweepy
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils.deadline import Deadline
+from utils.similarity import check_recent_posts, get_draft_index, record_post
+
 class SendTweetTool(Tool):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        deadline = Deadline.start()
+        
         # Extract draft_id from parameters
         draft_id = tool_parameters.get("draft_id")
         
@@ -39,6 +44,12 @@ class SendTweetTool(Tool):
             # Get credentials from tool provider
             credentials = self.credentials
             
+            _, duplicate_error = check_recent_posts(credentials, content, tool_parameters.get("allow_duplicates"))
+            
+            if duplicate_error:
+                yield self.create_error_message(duplicate_error)
+                return
+            
             # Create Twitter client
             client = tweepy.Client(
                 consumer_key=credentials["api_key"],
@@ -47,6 +58,9 @@ class SendTweetTool(Tool):
                 access_token_secret=credentials["access_token_secret"]
             )
             
+            # tweepy doesn't take a timeout, so only avoid starting once time has run out
+            deadline.check("send the tweet")
+            
             # Send the tweet
             response = client.create_tweet(text=content)
             
@@ -55,6 +69,8 @@ class SendTweetTool(Tool):
             
             # Delete the draft after publishing
             os.remove(draft_file_path)
+            get_draft_index().remove(draft_id)
+            record_post(credentials, tweet_id, content)
             
             # Return success message
             yield self.create_json_message({
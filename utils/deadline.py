@@ -0,0 +1,93 @@
+import time
+from contextvars import ContextVar
+
+
+MAX_REQUEST_TIMEOUT = 120  # Time Dify waits for a tool invocation (seconds)
+RESPONSE_MARGIN = 5  # Time kept to return the result before Dify gives up (seconds)
+MIN_PHASE_TIMEOUT = 1  # Phases with less time than this are not started (seconds)
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when an invocation can no longer finish before its deadline
+    """
+
+
+class Deadline:
+    """
+    Time budget of one tool invocation
+
+    Created when the invocation starts and passed to every network call,
+    which takes its timeout from the time remaining. Work stops as soon as
+    it can no longer finish in time, instead of running on after the
+    caller has given up.
+    """
+
+    def __init__(self, budget: float):
+        self.expires_at = time.monotonic() + budget
+
+    @classmethod
+    def start(cls) -> "Deadline":
+        """
+        Create the deadline of a new invocation
+
+        Invocations run by a background job use the job's deadline instead
+        of the request timeout.
+
+        Returns:
+            Deadline of the invocation
+        """
+        return current_deadline.get(None) or cls(MAX_REQUEST_TIMEOUT - RESPONSE_MARGIN)
+
+    def remaining(self) -> float:
+        """
+        Get the time left (seconds)
+        """
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self, phase: str) -> None:
+        """
+        Stop if there isn't enough time left to start a phase
+
+        Args:
+            phase: Description of the phase, used in the error message
+
+        Raises:
+            DeadlineExceeded: If less than MIN_PHASE_TIMEOUT remains
+        """
+        if self.remaining() < MIN_PHASE_TIMEOUT:
+            raise DeadlineExceeded(f"Not enough time left to {phase}")
+
+    def timeout(self, cap: float, phase: str, share: float = 1.0) -> float:
+        """
+        Get the timeout of a network call
+
+        Args:
+            cap: Longest timeout the call should ever use (seconds)
+            phase: Description of the phase, used in the error message
+            share: Fraction of the remaining time the call may use, leaving the rest for later phases
+
+        Returns:
+            Timeout in seconds
+
+        Raises:
+            DeadlineExceeded: If less than MIN_PHASE_TIMEOUT remains
+        """
+        self.check(phase)
+        return max(MIN_PHASE_TIMEOUT, min(cap, self.remaining() * share))
+
+    def phase(self, share: float) -> "Deadline":
+        """
+        Get the deadline of a phase made of several calls
+
+        Args:
+            share: Fraction of the remaining time the phase may use
+
+        Returns:
+            Deadline expiring when the phase's share is used up
+        """
+        return Deadline(self.remaining() * share)
+
+
+# Deadline of the background job running in the current thread, if any
+current_deadline: ContextVar[Deadline] = ContextVar("current_deadline")
@@ -0,0 +1,185 @@
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.deadline import Deadline, DeadlineExceeded
+
+
+class RangedDownloader:
+    """
+    Downloads files in parallel byte ranges
+
+    The first MIN_RANGED_SIZE bytes are requested as a range. If the
+    server ignores the range, or the range holds the whole file, the
+    response is streamed as a single download. Otherwise the file is
+    preallocated and its ranges are fetched concurrently, the first one
+    from the probe response, each written at its own offset and retried
+    on its own from the last byte received.
+    """
+    RANGE_SIZE = 8 * 1024 * 1024  # Bytes per range request
+    MIN_RANGED_SIZE = 16 * 1024 * 1024  # Files up to this size are downloaded in one stream
+    MAX_WORKERS = 4  # Ranges downloaded concurrently
+    RANGE_RETRIES = 3  # Attempts per range
+    CHUNK_SIZE = 64 * 1024  # Bytes read from the network at a time
+
+    _CONTENT_RANGE_PATTERN = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+)')
+
+    def _new_session(self) -> requests.Session:
+        """
+        Create a session whose connection pool is shared by every range worker
+        """
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_maxsize=self.MAX_WORKERS))
+        session.mount('http://', HTTPAdapter(pool_maxsize=self.MAX_WORKERS))
+        return session
+
+    def download(self, url: str, file_extension: str, timeout: float, verify_ssl: bool = True, deadline: Deadline = None) -> str:
+        """
+        Download a file to a temporary file
+
+        Args:
+            url: File URL
+            file_extension: Suffix of the temporary file
+            timeout: Timeout of each request (seconds)
+            verify_ssl: Whether to verify SSL certificates
+            deadline: Deadline of the whole download; requests are cut short by it
+
+        Returns:
+            Temporary file path or None if the download failed
+        """
+        session = self._new_session()
+        temp_path = None
+
+        try:
+            # Small files fit in the probe, so they take a single request
+            response = session.get(url, headers={'Range': f'bytes=0-{self.MIN_RANGED_SIZE - 1}'}, stream=True, timeout=self._timeout(timeout, deadline), verify=verify_ssl)
+            response.raise_for_status()
+
+            with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
+                temp_path = temp_file.name
+
+                content_range = self._content_range(response)
+                if response.status_code == 206:
+                    if content_range is None or content_range[0] != 0:
+                        raise IOError("Unexpected Content-Range in range probe response")
+                    _, probe_end, total_size = content_range
+
+                if response.status_code != 206 or probe_end == total_size - 1:
+                    # The server ignored the range or sent the whole file, written in chunks to handle large files
+                    for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                        if chunk:
+                            temp_file.write(chunk)
+                            self._check(deadline)
+                    return temp_path
+
+                # Preallocate so every range can be written at its offset
+                temp_file.truncate(total_size)
+
+            # The probe response carries the first range, the rest are requested
+            ranges = [(0, probe_end, response)]
+            ranges += [(start, min(start + self.RANGE_SIZE, total_size) - 1, None) for start in range(probe_end + 1, total_size, self.RANGE_SIZE)]
+            with ThreadPoolExecutor(max_workers=min(self.MAX_WORKERS, len(ranges))) as executor:
+                results = list(executor.map(lambda byte_range: self._download_range(session, url, temp_path, *byte_range, timeout, verify_ssl, deadline), ranges))
+
+            if not all(results):
+                raise IOError("Failed to download every range")
+
+            return temp_path
+
+        except Exception:
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
+            return None
+        finally:
+            session.close()
+
+    @staticmethod
+    def _timeout(timeout: float, deadline: Deadline) -> float:
+        """
+        Get the timeout of a request, shortened to the time left before the deadline
+        """
+        return deadline.timeout(timeout, "download the media") if deadline else timeout
+
+    @staticmethod
+    def _check(deadline: Deadline) -> None:
+        """
+        Stop a download that has run past its deadline
+        """
+        if deadline and not deadline.remaining():
+            raise DeadlineExceeded("Media download did not finish in time")
+
+    def _content_range(self, response: requests.Response) -> tuple[int, int, int]:
+        """
+        Get the bytes a range response holds
+
+        Returns:
+            Tuple of (first byte, last byte, total size), or None if the response isn't a range
+        """
+        if response.status_code != 206:
+            return None
+
+        match = self._CONTENT_RANGE_PATTERN.match(response.headers.get('Content-Range', ''))
+        if not match:
+            return None
+
+        return int(match.group(1)), int(match.group(2)), int(match.group(3))
+
+    def _download_range(self, session: requests.Session, url: str, path: str, start: int, end: int, response: requests.Response, timeout: float, verify_ssl: bool, deadline: Deadline = None) -> bool:
+        """
+        Download one byte range into its place in the file
+
+        Args:
+            session: Session of the download, shared by every range
+            url: File URL
+            path: Preallocated file path
+            start: First byte of the range
+            end: Last byte of the range (inclusive)
+            response: Response already requested for the range, used for the first attempt, or None
+            timeout: Request timeout (seconds)
+            verify_ssl: Whether to verify SSL certificates
+            deadline: Deadline of the whole download
+
+        Returns:
+            Whether the whole range was written
+        """
+        position = start
+
+        with open(path, 'r+b') as f:
+            for _ in range(self.RANGE_RETRIES):
+                try:
+                    if response is None:
+                        response = session.get(url, headers={'Range': f'bytes={position}-{end}'}, stream=True, timeout=self._timeout(timeout, deadline), verify=verify_ssl)
+
+                    content_range = self._content_range(response)
+                    if content_range is None or content_range[0] != position:
+                        # Bytes from anywhere else would be written at the wrong offset
+                        continue
+
+                    f.seek(position)
+                    for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                        if chunk:
+                            f.write(chunk)
+                            position += len(chunk)
+                            self._check(deadline)
+
+                    if position > end:
+                        return True
+                except requests.exceptions.RequestException:
+                    # Retry from the last byte received instead of the start of the range
+                    continue
+                except DeadlineExceeded:
+                    return False
+                finally:
+                    if response is not None:
+                        response.close()
+                    response = None
+
+        return False
+
+
+# Shared by all tools running in this plugin process
+ranged_downloader = RangedDownloader()
@@ -0,0 +1,195 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from utils.deadline import Deadline, DeadlineExceeded
+
+
+class IdempotencyStore:
+    """
+    Bounded, in-memory TTL store of recent post results
+
+    Dify retries a workflow step when it times out, which re-invokes the tool
+    with the same parameters. Results of successful posts are kept here so a
+    repeated request returns the original tweet instead of posting it again.
+    """
+    DEFAULT_TTL = 60 * 60  # Keep results for one hour (seconds)
+    DEFAULT_MAX_ENTRIES = 1024  # Oldest entries are evicted beyond this size
+
+    def __init__(self, ttl: int = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Lock and number of holders or waiters for each key in use
+        self._key_locks: dict[str, list] = {}
+
+    @contextmanager
+    def key_lock(self, key: str, deadline: Deadline) -> Iterator[None]:
+        """
+        Hold the lock of a key
+
+        Holding it while posting makes a concurrent retry wait for the first
+        attempt and then pick up its result rather than racing it. Requests
+        with other keys never wait on it.
+
+        Args:
+            key: Idempotency key
+            deadline: Deadline of the caller, which bounds the wait
+
+        Raises:
+            DeadlineExceeded: If the lock isn't released before the deadline
+        """
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+
+        try:
+            if not entry[0].acquire(timeout=deadline.remaining()):
+                raise DeadlineExceeded("An earlier request with the same content or idempotency key is still running")
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    def get(self, key: str) -> dict[str, Any]:
+        """
+        Get the stored result for a key
+
+        Args:
+            key: Idempotency key
+
+        Returns:
+            Copy of the stored result or None if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, result = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+
+            return dict(result)
+
+    def put(self, key: str, result: dict[str, Any]) -> None:
+        """
+        Store the result of a successful post
+
+        Args:
+            key: Idempotency key
+            result: JSON result returned to the caller
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, dict(result))
+            self._entries.move_to_end(key)
+
+            # Evict expired entries first, then the oldest ones
+            now = time.monotonic()
+            for stale_key in [k for k, (expires_at, _) in self._entries.items() if expires_at < now]:
+                del self._entries[stale_key]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard_tweet(self, tweet_id: str) -> None:
+        """
+        Forget every stored result pointing at a tweet
+
+        Used when a tweet is deleted, so posting the same content again
+        creates a new tweet instead of returning the deleted one.
+
+        Args:
+            tweet_id: ID of the deleted tweet
+        """
+        with self._lock:
+            for key in [k for k, (_, result) in self._entries.items() if result.get("tweet_id") == tweet_id]:
+                del self._entries[key]
+
+
+def account_fingerprint(credentials: dict[str, Any]) -> str:
+    """
+    Identify an account without storing its credentials
+
+    Args:
+        credentials: Provider credentials
+
+    Returns:
+        Hex digest of the app key and access token
+    """
+    return hashlib.sha256(f"{credentials.get('api_key', '')}:{credentials.get('access_token', '')}".encode()).hexdigest()
+
+
+def credentials_fingerprint(credentials: dict[str, Any]) -> str:
+    """
+    Identify a complete set of credentials, secrets included
+
+    Unlike account_fingerprint, this differs when a secret is wrong or has
+    been rotated, so it's used wherever credentials are cached.
+
+    Args:
+        credentials: Provider credentials
+
+    Returns:
+        Hex digest of the app key, access token and both secrets
+    """
+    fields = [credentials.get(cred, '') for cred in ('api_key', 'api_secret', 'access_token', 'access_token_secret')]
+    return hashlib.sha256("\x00".join(fields).encode()).hexdigest()
+
+
+def build_idempotency_key(credentials: dict[str, Any], text: str, media_hash: str = None, idempotency_key: str = None) -> str:
+    """
+    Build the key identifying a post request
+
+    Args:
+        credentials: Provider credentials of the posting account
+        text: Tweet text
+        media_hash: SHA-256 of the attached media, if any
+        idempotency_key: Key supplied by the caller, used instead of the content
+
+    Returns:
+        Hex digest scoped to the posting account
+    """
+    digest = hashlib.sha256()
+    # Scope keys to the account so the same text can be posted from different accounts
+    digest.update(account_fingerprint(credentials).encode())
+    if idempotency_key:
+        digest.update(b"\x00key\x00" + idempotency_key.encode())
+    else:
+        digest.update(b"\x00text\x00" + text.encode())
+        digest.update(b"\x00media\x00" + (media_hash or "").encode())
+    return digest.hexdigest()
+
+
+def hash_file(file_path: str) -> str:
+    """
+    Compute the SHA-256 of a file without loading it into memory
+
+    Args:
+        file_path: File path
+
+    Returns:
+        Hex digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Shared by all tools running in this plugin process
+idempotency_store = IdempotencyStore()
+
+# Media IDs of recent uploads, keyed on account and media content
+uploaded_media_store = IdempotencyStore()
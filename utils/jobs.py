@@ -0,0 +1,281 @@
+import importlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from cryptography.fernet import Fernet
+from dify_plugin.entities.tool import ToolInvokeMessage, ToolRuntime
+
+from utils.deadline import Deadline, current_deadline
+from utils.idempotency import account_fingerprint
+
+
+class JobQueue:
+    """
+    Durable queue of tool invocations processed by a background worker pool
+
+    Long media posts can outlive the request that started them, so tools can
+    hand their work to this queue and return a job ID immediately. Job state
+    is kept in SQLite and can be read back with the job_status tool.
+
+    Media is fetched into the job's directory as soon as the job is queued,
+    by fetch workers separate from the ones running jobs, so a job waiting
+    for a worker doesn't outlive Dify's signed file URL. The job's tool,
+    parameters and credentials (encrypted) are then stored with it, so jobs
+    still waiting for a worker are resumed after a restart. Jobs that were
+    running or fetching are marked as failed instead, since they may have
+    posted already or their media can no longer be fetched.
+    """
+    DEFAULT_DIRECTORY = "jobs"
+    MAX_WORKERS = 2  # Number of jobs processed concurrently
+    MAX_FETCH_WORKERS = 4  # Number of jobs fetching their media concurrently
+    RETENTION = 7 * 24 * 60 * 60  # Finished jobs are kept for a week (seconds)
+    JOB_TIMEOUT = 30 * 60  # Time a job may run, instead of the request timeout (seconds)
+    FETCH_TIMEOUT = 10 * 60  # Time a job may spend fetching its media (seconds)
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, max_workers: int = MAX_WORKERS):
+        self.directory = directory
+        self.path = os.path.join(directory, "jobs.db")
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._fetch_executor = None
+        self._fernet = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Open a connection to the job database, creating it on first use
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _load_key(self) -> Fernet:
+        """
+        Get the key encrypting stored job credentials, creating it on first use
+
+        Must be called with the lock held.
+        """
+        key_path = os.path.join(self.directory, "key")
+        try:
+            with open(os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as f:
+                f.write(Fernet.generate_key())
+        except FileExistsError:
+            pass
+        with open(key_path, "rb") as f:
+            return Fernet(f.read())
+
+    def _start(self) -> ThreadPoolExecutor:
+        """
+        Create the schema and the worker pools on first use, resuming jobs left by a previous process
+        """
+        with self._lock:
+            if self._executor is None:
+                with self._connect() as connection:
+                    connection.execute(
+                        "CREATE TABLE IF NOT EXISTS jobs ("
+                        "id TEXT PRIMARY KEY, owner TEXT NOT NULL, tool TEXT NOT NULL, "
+                        "status TEXT NOT NULL, progress TEXT, result TEXT, error TEXT, "
+                        "created_at REAL NOT NULL, updated_at REAL NOT NULL, payload TEXT)"
+                    )
+                    # Databases created before payloads were stored lack the column
+                    columns = [row["name"] for row in connection.execute("PRAGMA table_info(jobs)")]
+                    if "payload" not in columns:
+                        connection.execute("ALTER TABLE jobs ADD COLUMN payload TEXT")
+
+                    now = time.time()
+                    # Running jobs may have posted already, and fetching jobs have lost their media reference
+                    interrupted = connection.execute(
+                        "SELECT id FROM jobs WHERE status = ? OR (status = ? AND payload IS NULL)",
+                        (self.RUNNING, self.QUEUED)
+                    ).fetchall()
+                    connection.execute(
+                        "UPDATE jobs SET status = ?, error = ?, payload = NULL, updated_at = ? WHERE status = ? OR (status = ? AND payload IS NULL)",
+                        (self.FAILED, "Interrupted by plugin restart", now, self.RUNNING, self.QUEUED)
+                    )
+                    resumed = connection.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (self.QUEUED,)).fetchall()
+                    connection.execute("DELETE FROM jobs WHERE updated_at < ?", (now - self.RETENTION,))
+
+                for row in interrupted:
+                    shutil.rmtree(os.path.join(self.directory, row["id"]), ignore_errors=True)
+
+                self._fernet = self._load_key()
+                self._fetch_executor = ThreadPoolExecutor(max_workers=self.MAX_FETCH_WORKERS, thread_name_prefix="x-job-fetch")
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="x-job")
+                for row in resumed:
+                    self._executor.submit(self._process, row["id"])
+            return self._executor
+
+    def resume(self) -> None:
+        """
+        Resume jobs left waiting for a worker by a previous process
+        """
+        self._start()
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        """
+        Update columns of a job record
+        """
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._connect() as connection:
+            connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def submit(self, credentials: dict[str, Any], tool: str, tool_class: type, parameters: dict[str, Any], fetch: Callable[[str], dict[str, Any]] = None) -> str:
+        """
+        Queue a tool invocation for background processing
+
+        Args:
+            credentials: Provider credentials of the calling account
+            tool: Name of the tool being run
+            tool_class: Tool class invoked by the job
+            parameters: JSON-serializable tool parameters
+            fetch: Callable run when the job is queued, given the job's directory, that
+                fetches its media there and returns the parameters pointing at it
+
+        Returns:
+            Job ID
+        """
+        executor = self._start()
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, owner, tool, status, progress, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, account_fingerprint(credentials), tool, self.QUEUED, "Fetching media" if fetch else "Waiting for a worker", now, now)
+            )
+
+        if fetch:
+            self._fetch_executor.submit(self._fetch, job_id, credentials, tool_class, parameters, fetch)
+        else:
+            self._store(job_id, credentials, tool_class, parameters)
+            executor.submit(self._process, job_id)
+        return job_id
+
+    def _fetch(self, job_id: str, credentials: dict[str, Any], tool_class: type, parameters: dict[str, Any], fetch: Callable[[str], dict[str, Any]]) -> None:
+        """
+        Fetch a job's media, then hand the job to the workers
+        """
+        job_directory = os.path.join(self.directory, job_id)
+        os.makedirs(job_directory, exist_ok=True)
+
+        token = current_deadline.set(Deadline(self.FETCH_TIMEOUT))
+        try:
+            parameters = {**parameters, **fetch(job_directory)}
+        except Exception as e:
+            shutil.rmtree(job_directory, ignore_errors=True)
+            self._update(job_id, status=self.FAILED, error=str(e))
+            return
+        finally:
+            current_deadline.reset(token)
+
+        self._store(job_id, credentials, tool_class, parameters)
+        self._executor.submit(self._process, job_id)
+
+    def _store(self, job_id: str, credentials: dict[str, Any], tool_class: type, parameters: dict[str, Any]) -> None:
+        """
+        Save what a worker needs to run the job, so it survives a restart
+        """
+        payload = {
+            "tool_class": f"{tool_class.__module__}:{tool_class.__qualname__}",
+            "parameters": parameters,
+            "credentials": self._fernet.encrypt(json.dumps(credentials).encode()).decode()
+        }
+        self._update(job_id, progress="Waiting for a worker", payload=json.dumps(payload))
+
+    def _process(self, job_id: str) -> None:
+        """
+        Run a job, recording text messages as progress and the JSON message as its result
+        """
+        with self._connect() as connection:
+            row = connection.execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        payload = json.loads(row["payload"])
+
+        self._update(job_id, status=self.RUNNING, progress="Started")
+
+        result = None
+        last_text = None
+
+        # Tools started by the job pick up this deadline instead of the request's
+        token = current_deadline.set(Deadline(self.JOB_TIMEOUT))
+        try:
+            module_name, class_name = payload["tool_class"].split(":")
+            tool_class = getattr(importlib.import_module(module_name), class_name)
+            credentials = json.loads(self._fernet.decrypt(payload["credentials"].encode()))
+            tool = tool_class(runtime=ToolRuntime(credentials=credentials, user_id=None, session_id=None), session=None)
+
+            for message in tool._invoke(payload["parameters"]):
+                if message.type == ToolInvokeMessage.MessageType.JSON:
+                    result = message.message.json_object
+                elif message.type == ToolInvokeMessage.MessageType.TEXT:
+                    last_text = message.message.text
+                    self._update(job_id, progress=last_text)
+        except Exception as e:
+            self._finish(job_id, status=self.FAILED, error=str(e))
+            return
+        finally:
+            current_deadline.reset(token)
+
+        if result is not None:
+            self._finish(job_id, status=self.SUCCEEDED, progress="Completed", result=json.dumps(result))
+        else:
+            # Tools report failures as text messages, so the last one is the error
+            self._finish(job_id, status=self.FAILED, error=last_text or "Job finished without a result")
+
+    def _finish(self, job_id: str, **fields: Any) -> None:
+        """
+        Record the outcome of a job and drop its stored credentials and media
+        """
+        self._update(job_id, payload=None, **fields)
+        shutil.rmtree(os.path.join(self.directory, job_id), ignore_errors=True)
+
+    def get(self, credentials: dict[str, Any], job_id: str) -> dict[str, Any]:
+        """
+        Get the state of a job
+
+        Args:
+            credentials: Provider credentials of the calling account
+            job_id: Job ID
+
+        Returns:
+            Job state or None if no job with this ID belongs to the account
+        """
+        self._start()
+
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE id = ? AND owner = ?",
+                (job_id, account_fingerprint(credentials))
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            "job_id": row["id"],
+            "tool": row["tool"],
+            "job_status": row["status"],
+            "progress": row["progress"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"]
+        }
+
+
+# Shared by all tools running in this plugin process
+job_queue = JobQueue()
@@ -0,0 +1,201 @@
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import Any
+
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.idempotency import credentials_fingerprint
+from utils.transport import get_session
+
+
+class TweetLookupService:
+    """
+    Coalesces tweet lookups into batched /2/tweets requests
+
+    Lookups from concurrent invocations for the same account are collected
+    for a short window and sent as one request of up to 100 IDs. Results are
+    cached briefly, so dashboards polling the same tweets share requests.
+    """
+    LOOKUP_URL = 'https://api.twitter.com/2/tweets'
+    TWEET_FIELDS = 'created_at,author_id,public_metrics,conversation_id,lang'
+
+    BATCH_WINDOW = 0.05  # Time to wait for more IDs before sending a batch (seconds)
+    MAX_BATCH_SIZE = 100  # Maximum number of IDs accepted by /2/tweets
+    CACHE_TTL = 15  # Time results are reused for (seconds)
+    MAX_CACHE_ENTRIES = 10000
+    LOOKUP_TIMEOUT = 30  # Lookup request timeout (seconds)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: dict[str, dict[str, list[Future]]] = {}
+        self._credentials: dict[str, dict[str, Any]] = {}
+        self._timers: dict[str, threading.Timer] = {}
+        self._cache: dict[tuple[str, str], tuple[float, dict[str, Any]]] = {}
+
+    def lookup(self, credentials: dict[str, Any], tweet_ids: list[str], deadline: Deadline = None) -> dict[str, dict[str, Any]]:
+        """
+        Look up tweets, sharing requests with concurrent callers
+
+        Args:
+            credentials: X API credentials of the account
+            tweet_ids: Tweet IDs
+            deadline: Deadline of the caller; waiting stops when it passes
+
+        Returns:
+            Tweet data, or {"error": ...} for tweets that couldn't be found, by tweet ID
+        """
+        # Batches and cached results are shared only by callers with the same credentials
+        account = credentials_fingerprint(credentials)
+        results = {}
+        futures = {}
+
+        with self._lock:
+            now = time.monotonic()
+            for tweet_id in tweet_ids:
+                cached = self._cache.get((account, tweet_id))
+                if cached and cached[0] > now:
+                    results[tweet_id] = cached[1]
+                    continue
+
+                future = Future()
+                self._pending.setdefault(account, {}).setdefault(tweet_id, []).append(future)
+                futures[tweet_id] = future
+
+            if futures:
+                self._credentials[account] = credentials
+                if len(self._pending[account]) >= self.MAX_BATCH_SIZE:
+                    # A full batch doesn't need to wait for the window
+                    self._schedule(account, 0)
+                elif account not in self._timers:
+                    self._schedule(account, self.BATCH_WINDOW)
+
+        timeout = self.BATCH_WINDOW + self.LOOKUP_TIMEOUT
+        if deadline:
+            timeout = deadline.timeout(timeout, "look up the tweets")
+        wait(futures.values(), timeout=timeout)
+
+        for tweet_id, future in futures.items():
+            if not future.done():
+                # The batch keeps running for other callers, but this one can't wait any longer
+                raise DeadlineExceeded("Tweet lookup did not finish in time")
+            # Raises the request error
+            results[tweet_id] = future.result()
+
+        return results
+
+    def _schedule(self, account: str, delay: float) -> None:
+        """
+        Send the account's pending lookups after a delay, replacing any scheduled send
+
+        Must be called with the lock held.
+        """
+        timer = self._timers.pop(account, None)
+        if timer:
+            timer.cancel()
+
+        timer = threading.Timer(delay, self._flush, args=(account,))
+        timer.daemon = True
+        self._timers[account] = timer
+        timer.start()
+
+    def _flush(self, account: str) -> None:
+        """
+        Send one batch of pending lookups for an account and resolve its callers
+        """
+        with self._lock:
+            if self._timers.get(account) is threading.current_thread():
+                del self._timers[account]
+
+            pending = self._pending.get(account)
+            if not pending:
+                # Another send already took these lookups
+                return
+
+            batch = {tweet_id: pending.pop(tweet_id) for tweet_id in list(pending)[:self.MAX_BATCH_SIZE]}
+            credentials = self._credentials[account]
+
+            if pending:
+                # IDs beyond this batch go out right after it
+                self._schedule(account, 0)
+            else:
+                del self._pending[account]
+                del self._credentials[account]
+
+        try:
+            tweets = self._fetch(credentials, list(batch))
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    future.set_exception(e)
+            return
+
+        with self._lock:
+            expires_at = time.monotonic() + self.CACHE_TTL
+            for tweet_id, tweet in tweets.items():
+                # Re-insert so the cache stays ordered by expiry
+                self._cache.pop((account, tweet_id), None)
+                self._cache[(account, tweet_id)] = (expires_at, tweet)
+            self._prune_cache()
+
+        for tweet_id, futures in batch.items():
+            tweet = tweets.get(tweet_id, {"error": "Tweet not returned by X"})
+            for future in futures:
+                future.set_result(tweet)
+
+    def _prune_cache(self) -> None:
+        """
+        Drop expired results, then the oldest ones if the cache is full
+
+        Must be called with the lock held.
+        """
+        if len(self._cache) <= self.MAX_CACHE_ENTRIES:
+            return
+
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self._cache.items() if expires_at < now]:
+            del self._cache[key]
+
+        # Entries are inserted in expiry order, so the first ones are the oldest
+        for key in list(self._cache)[:len(self._cache) - self.MAX_CACHE_ENTRIES]:
+            del self._cache[key]
+
+    def _fetch(self, credentials: dict[str, Any], tweet_ids: list[str]) -> dict[str, dict[str, Any]]:
+        """
+        Look up a batch of tweets with one request
+
+        Args:
+            credentials: X API credentials of the account
+            tweet_ids: Up to 100 tweet IDs
+
+        Returns:
+            Tweet data, or {"error": ...} for tweets that couldn't be found, by tweet ID
+        """
+        oauth = get_session(credentials)
+
+        params = {
+            'ids': ','.join(tweet_ids),
+            'tweet.fields': self.TWEET_FIELDS
+        }
+
+        response = oauth.get(self.LOOKUP_URL, params=params, timeout=self.LOOKUP_TIMEOUT)
+
+        if response.status_code != 200:
+            raise RuntimeError(f"Failed to look up tweets. Status code: {response.status_code}, Response: {response.text}")
+
+        response_data = response.json()
+
+        tweets = {}
+        for tweet in response_data.get('data', []):
+            tweets[tweet['id']] = tweet
+
+        # Deleted, protected or unknown tweets are reported as errors instead of data
+        for error in response_data.get('errors', []):
+            tweet_id = error.get('resource_id') or error.get('value')
+            if tweet_id and tweet_id not in tweets:
+                tweets[tweet_id] = {"error": error.get('detail') or error.get('title') or "Tweet not found"}
+
+        return tweets
+
+
+# Shared by all tools running in this plugin process
+tweet_lookup_service = TweetLookupService()
@@ -0,0 +1,266 @@
+import os
+import struct
+import tempfile
+
+
+class UnsupportedContainerError(ValueError):
+    """
+    Raised when a video container can't be processed by X
+    """
+
+
+# Atoms whose children are parsed to find codecs and chunk offset tables
+CONTAINER_ATOMS = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+# Codecs X can process, by track handler type
+SUPPORTED_CODECS = {
+    b'vide': {b'avc1', b'avc3'},  # H.264
+    b'soun': {b'mp4a'},  # AAC
+}
+
+# Brands marking a QuickTime file, rewritten to MP4 brands when remuxing
+QUICKTIME_BRAND = b'qt  '
+MP4_FTYP = struct.pack('>I4s4sI4s4s', 24, b'ftyp', b'mp42', 0, b'isom', b'mp42')
+
+COPY_CHUNK_SIZE = 1024 * 1024  # Copy media data in 1MB chunks
+
+
+def _read_top_level_atoms(f, file_size: int) -> list[tuple[bytes, int, int]]:
+    """
+    List the top-level atoms of an ISO-BMFF file
+
+    Args:
+        f: File opened in binary mode
+        file_size: Size of the file
+
+    Returns:
+        List of (type, offset, size) tuples
+    """
+    atoms = []
+    offset = 0
+    while offset < file_size:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            raise UnsupportedContainerError("Video file is truncated")
+
+        size, atom_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            # 64-bit size follows the type
+            large_size = f.read(8)
+            if len(large_size) < 8:
+                raise UnsupportedContainerError("Video file is truncated")
+            size = struct.unpack('>Q', large_size)[0]
+            header_size = 16
+        elif size == 0:
+            # Atom extends to the end of the file
+            size = file_size - offset
+
+        if size < header_size or offset + size > file_size or not atom_type.isascii():
+            raise UnsupportedContainerError("Video file is not a valid MP4 or MOV container")
+
+        atoms.append((atom_type, offset, size))
+        offset += size
+
+    return atoms
+
+
+def _walk(buffer: bytearray, start: int, end: int):
+    """
+    Iterate over the atoms of an in-memory buffer
+
+    Args:
+        buffer: Atom data
+        start: Offset of the first atom
+        end: Offset after the last atom
+
+    Yields:
+        (type, payload offset, atom end) tuples
+    """
+    offset = start
+    while offset + 8 <= end:
+        size, atom_type = struct.unpack_from('>I4s', buffer, offset)
+        header_size = 8
+        if size == 1:
+            if offset + 16 > end:
+                raise UnsupportedContainerError("Video file has a corrupt movie header")
+            size = struct.unpack_from('>Q', buffer, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+
+        if size < header_size or offset + size > end:
+            raise UnsupportedContainerError("Video file has a corrupt movie header")
+
+        yield atom_type, offset + header_size, offset + size
+        offset += size
+
+
+def _inspect_moov(moov: bytearray) -> tuple[list[tuple[bytes, set[bytes]]], list[tuple[int, int, int]]]:
+    """
+    Find the tracks and chunk offset tables of a moov atom
+
+    Args:
+        moov: Complete moov atom
+
+    Returns:
+        Tuple of ([(handler type, codecs)], [(table offset, entry count, entry size)])
+    """
+    tracks = []
+    offset_tables = []
+
+    def visit(start: int, end: int, parent: bytes, track: dict) -> None:
+        for atom_type, payload, atom_end in _walk(moov, start, end):
+            if atom_type == b'cmov':
+                raise UnsupportedContainerError("Compressed QuickTime movie headers are not supported")
+
+            if atom_type == b'trak':
+                track = {'handler': None, 'codecs': set()}
+                visit(payload, atom_end, atom_type, track)
+                tracks.append((track['handler'], track['codecs']))
+            elif atom_type in CONTAINER_ATOMS:
+                visit(payload, atom_end, atom_type, track)
+            elif atom_type == b'hdlr' and parent == b'mdia' and atom_end - payload >= 12:
+                # Full box header, pre_defined (QuickTime component type), then handler type
+                track['handler'] = bytes(moov[payload + 8:payload + 12])
+            elif atom_type == b'stsd' and atom_end - payload >= 8:
+                # Full box header and entry count, then sample entries named after their codec
+                for codec, _, _ in _walk(moov, payload + 8, atom_end):
+                    track['codecs'].add(codec)
+            elif atom_type in (b'stco', b'co64') and atom_end - payload >= 8:
+                entry_count = struct.unpack_from('>I', moov, payload + 4)[0]
+                entry_size = 4 if atom_type == b'stco' else 8
+                if payload + 8 + entry_count * entry_size > atom_end:
+                    raise UnsupportedContainerError("Video file has a corrupt chunk offset table")
+                offset_tables.append((payload + 8, entry_count, entry_size))
+
+    header_size = 16 if struct.unpack_from('>I', moov)[0] == 1 else 8
+    visit(header_size, len(moov), b'moov', {'handler': None, 'codecs': set()})
+    return tracks, offset_tables
+
+
+def _check_codecs(tracks: list[tuple[bytes, set[bytes]]]) -> None:
+    """
+    Reject files whose audio or video codecs X can't process
+
+    Args:
+        tracks: List of (handler type, codecs) tuples
+    """
+    if not any(handler == b'vide' for handler, _ in tracks):
+        raise UnsupportedContainerError("Video file has no video track")
+
+    for handler, codecs in tracks:
+        supported = SUPPORTED_CODECS.get(handler)
+        # Other tracks (timecode, metadata) are left for X to ignore
+        if supported is None:
+            continue
+
+        unsupported = codecs - supported
+        if unsupported:
+            names = ", ".join(sorted(codec.decode('ascii', 'replace').strip() for codec in unsupported))
+            kind = "video" if handler == b'vide' else "audio"
+            raise UnsupportedContainerError(f"Unsupported {kind} codec: {names}. Please use H.264 video with AAC audio")
+
+
+def normalize_mp4(file_path: str) -> str:
+    """
+    Prepare an MP4 or MOV file for upload to X
+
+    Moves the moov atom in front of the media data ("faststart") and rewrites
+    QuickTime files as MP4, patching chunk offsets instead of decoding the
+    media. Files that are already in the right shape are left untouched.
+
+    Args:
+        file_path: Path to the video file
+
+    Returns:
+        Path to the normalized file, which is file_path itself if no change was needed
+
+    Raises:
+        UnsupportedContainerError: If the container or codecs can't be processed by X
+    """
+    file_size = os.path.getsize(file_path)
+
+    with open(file_path, 'rb') as f:
+        magic = f.read(12)
+        if magic[:4] == b'RIFF':
+            raise UnsupportedContainerError("AVI videos are not supported. Please convert the video to MP4")
+        if magic[:4] == b'\x30\x26\xb2\x75':
+            raise UnsupportedContainerError("WMV videos are not supported. Please convert the video to MP4")
+
+        atoms = _read_top_level_atoms(f, file_size)
+        atom_types = [atom_type for atom_type, _, _ in atoms]
+
+        if b'moov' not in atom_types or b'mdat' not in atom_types:
+            raise UnsupportedContainerError("Video file is not a valid MP4 or MOV container")
+        if atom_types.count(b'moov') > 1:
+            raise UnsupportedContainerError("Video file has more than one movie header")
+
+        _, moov_offset, moov_size = atoms[atom_types.index(b'moov')]
+        f.seek(moov_offset)
+        moov = bytearray(f.read(moov_size))
+
+        tracks, offset_tables = _inspect_moov(moov)
+        _check_codecs(tracks)
+
+        ftyp = None
+        if b'ftyp' in atom_types:
+            _, ftyp_offset, ftyp_size = atoms[atom_types.index(b'ftyp')]
+            f.seek(ftyp_offset)
+            ftyp = f.read(ftyp_size)
+
+        is_quicktime = ftyp is None or ftyp[8:12] == QUICKTIME_BRAND
+        is_faststart = atom_types[0] == b'ftyp' and atom_types.index(b'moov') < atom_types.index(b'mdat')
+
+        if is_faststart and not is_quicktime:
+            return file_path
+
+        # New layout: ftyp, moov, then every other atom in its original order
+        if is_quicktime:
+            ftyp = MP4_FTYP
+        rest = [(atom_type, offset, size) for atom_type, offset, size in atoms if atom_type not in (b'ftyp', b'moov')]
+
+        new_offsets = []
+        position = len(ftyp) + moov_size
+        for atom_type, offset, size in rest:
+            new_offsets.append((offset, offset + size, position))
+            position += size
+
+        # Chunk offsets point into the media data, so move them along with the atom containing them
+        for table_offset, entry_count, entry_size in offset_tables:
+            entry_format = '>I' if entry_size == 4 else '>Q'
+            for index in range(entry_count):
+                entry_offset = table_offset + index * entry_size
+                chunk_offset = struct.unpack_from(entry_format, moov, entry_offset)[0]
+
+                for old_start, old_end, new_start in new_offsets:
+                    if old_start <= chunk_offset < old_end:
+                        chunk_offset = chunk_offset - old_start + new_start
+                        break
+                else:
+                    raise UnsupportedContainerError("Video file has a chunk offset outside the media data")
+
+                if entry_size == 4 and chunk_offset > 0xFFFFFFFF:
+                    raise UnsupportedContainerError("Video file is too large")
+                struct.pack_into(entry_format, moov, entry_offset, chunk_offset)
+
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as output:
+            try:
+                output.write(ftyp)
+                output.write(moov)
+                for atom_type, offset, size in rest:
+                    f.seek(offset)
+                    remaining = size
+                    while remaining > 0:
+                        chunk = f.read(min(COPY_CHUNK_SIZE, remaining))
+                        if not chunk:
+                            raise UnsupportedContainerError("Video file is truncated")
+                        output.write(chunk)
+                        remaining -= len(chunk)
+            except Exception:
+                output.close()
+                os.unlink(output.name)
+                raise
+
+            return output.name
@@ -0,0 +1,182 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+from typing import Any
+
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+
+REQUIRED_CREDENTIALS = ["api_key", "api_secret", "access_token", "access_token_secret"]
+
+
+class ProfileStoreError(Exception):
+    """
+    Raised when the profile store can't be read or a profile is missing
+    """
+
+
+class ProfileStore:
+    """
+    Local encrypted stores of named X account credentials
+
+    Each profile store key has its own store, so provider configurations
+    with different keys neither see nor overwrite each other's profiles.
+    A store is a single Fernet token in a file named after the key, both
+    derived from the key, so credentials never touch the disk in plain text
+    and file names don't reveal the key.
+    """
+    DEFAULT_DIRECTORY = "profiles"
+    KDF_ITERATIONS = 480000
+    MAX_CACHED_KEYS = 64  # Derived keys kept in memory, one per profile store key
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._salt = None
+        self._keys: dict[str, tuple[str, Fernet]] = {}
+
+    def _read_salt(self) -> bytes:
+        """
+        Get the salt of the key derivation, creating it on first use
+
+        Must be called with the lock held.
+        """
+        if self._salt is None:
+            salt_path = os.path.join(self.directory, "salt")
+            if not os.path.exists(salt_path):
+                os.makedirs(self.directory, exist_ok=True)
+                temp_path = f"{salt_path}.{os.getpid()}.tmp"
+                with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+                    f.write(base64.b64encode(os.urandom(16)).decode())
+                try:
+                    # Linking fails if another process created the salt first, whose salt then wins
+                    os.link(temp_path, salt_path)
+                except FileExistsError:
+                    pass
+                finally:
+                    os.unlink(temp_path)
+            with open(salt_path, "r") as f:
+                self._salt = base64.b64decode(f.read())
+        return self._salt
+
+    def _store(self, passphrase: str) -> tuple[str, Fernet]:
+        """
+        Derive the file path and encryption key of a passphrase's store
+
+        The derivation is slow on purpose, so its result is cached.
+
+        Must be called with the lock held.
+
+        Returns:
+            Tuple of (store path, Fernet)
+        """
+        cache_key = hashlib.sha256(passphrase.encode()).hexdigest()
+        store = self._keys.get(cache_key)
+        if store is None:
+            kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=64, salt=self._read_salt(), iterations=self.KDF_ITERATIONS)
+            derived = kdf.derive(passphrase.encode())
+            store = (
+                os.path.join(self.directory, f"{derived[32:48].hex()}.json"),
+                Fernet(base64.urlsafe_b64encode(derived[:32]))
+            )
+
+            if len(self._keys) >= self.MAX_CACHED_KEYS:
+                del self._keys[next(iter(self._keys))]
+            self._keys[cache_key] = store
+        return store
+
+    def _read(self, passphrase: str) -> dict[str, dict[str, str]]:
+        """
+        Decrypt all profiles of a passphrase's store
+
+        Must be called with the lock held.
+
+        Returns:
+            Profiles by name
+        """
+        path, fernet = self._store(passphrase)
+        if not os.path.exists(path):
+            return {}
+
+        with open(path, "r") as f:
+            stored = json.load(f)
+
+        try:
+            return json.loads(fernet.decrypt(stored["token"].encode()))
+        except InvalidToken:
+            raise ProfileStoreError("Profile store can't be decrypted")
+
+    @staticmethod
+    def _write(path: str, content: str) -> None:
+        """
+        Replace a file readable only by the plugin
+
+        A temporary file is written first so a crash can't leave a truncated file.
+        """
+        temp_path = f"{path}.tmp"
+        with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+    def load(self, passphrase: str, names: list[str]) -> dict[str, dict[str, str]]:
+        """
+        Get the credentials of named profiles
+
+        Args:
+            passphrase: Profile store key
+            names: Profile names
+
+        Returns:
+            Credentials by profile name
+        """
+        with self._lock:
+            profiles = self._read(passphrase)
+
+        missing = [name for name in names if name not in profiles]
+        if missing:
+            raise ProfileStoreError(f"Unknown account profiles: {', '.join(missing)}")
+
+        return {name: profiles[name] for name in names}
+
+    def names(self, passphrase: str) -> list[str]:
+        """
+        List the saved profile names
+
+        Args:
+            passphrase: Profile store key
+
+        Returns:
+            Sorted profile names
+        """
+        with self._lock:
+            profiles = self._read(passphrase)
+        return sorted(profiles)
+
+    def save(self, passphrase: str, name: str, credentials: dict[str, Any]) -> None:
+        """
+        Add or replace a profile
+
+        Args:
+            passphrase: Profile store key
+            name: Profile name
+            credentials: X API credentials of the account
+        """
+        for cred in REQUIRED_CREDENTIALS:
+            if not credentials.get(cred):
+                raise ProfileStoreError(f"Missing required credential: {cred}")
+
+        with self._lock:
+            profiles = self._read(passphrase)
+            profiles[name] = {cred: credentials[cred] for cred in REQUIRED_CREDENTIALS}
+
+            path, fernet = self._store(passphrase)
+            token = fernet.encrypt(json.dumps(profiles).encode())
+            self._write(path, json.dumps({"token": token.decode()}))
+
+
+# Shared by all tools running in this plugin process
+profile_store = ProfileStore()
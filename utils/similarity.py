@@ -0,0 +1,282 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from utils.idempotency import account_fingerprint
+
+
+SHINGLE_SIZE = 5  # Characters per shingle
+NUM_BINS = 32  # MinHash signature length
+BANDS = 8  # LSH bands; NUM_BINS / BANDS rows per band
+ROWS = NUM_BINS // BANDS
+DEFAULT_THRESHOLD = 0.8  # Jaccard similarity above which texts are near-duplicates
+DENSIFY_OFFSET = 1 << 64  # Larger than any bin value
+POSTED_TTL = 24 * 60 * 60  # Posts only count as recent for a day (seconds)
+
+_URL_PATTERN = re.compile(r'https?://\S+')
+_LINK_PATTERN = re.compile(r'https?://([^/?#\s]+)([^?#\s]*)')
+_SPACE_PATTERN = re.compile(r'\s+')
+
+
+def shingles(text: str) -> frozenset[int]:
+    """
+    Hash the overlapping character shingles of a normalized text
+
+    Case, whitespace and links are ignored, since X shortens links and
+    changes in spacing don't make a post distinct. Links are compared
+    separately, see links().
+
+    Args:
+        text: Tweet text
+
+    Returns:
+        Set of shingle hashes
+    """
+    normalized = _SPACE_PATTERN.sub(' ', _URL_PATTERN.sub(' ', text.lower())).strip()
+    if len(normalized) <= SHINGLE_SIZE:
+        return frozenset([hash(normalized)])
+    return frozenset(hash(normalized[i:i + SHINGLE_SIZE]) for i in range(len(normalized) - SHINGLE_SIZE + 1))
+
+
+def links(text: str) -> frozenset[str]:
+    """
+    Normalize the links of a text
+
+    Posts that only differ in their links, such as announcements of
+    successive episodes, are distinct for X and must not match.
+
+    Args:
+        text: Tweet text
+
+    Returns:
+        Set of links reduced to their host and path
+    """
+    return frozenset(host.lower() + path.rstrip('/') for host, path in _LINK_PATTERN.findall(text))
+
+
+def signature(shingle_hashes: frozenset[int]) -> tuple:
+    """
+    Compute a one-permutation MinHash signature
+
+    Each shingle hash is placed in a bin by its low bits and every bin keeps
+    its smallest value, so the signature costs one pass over the shingles.
+    Empty bins, common for short texts, borrow the next filled bin's value
+    (rotation densification) so every band stays usable.
+
+    Args:
+        shingle_hashes: Non-empty set of shingle hashes
+
+    Returns:
+        Tuple of NUM_BINS values
+    """
+    bins = [None] * NUM_BINS
+    for value in shingle_hashes:
+        value &= 0xFFFFFFFFFFFFFFFF
+        index = value % NUM_BINS
+        value //= NUM_BINS
+        if bins[index] is None or value < bins[index]:
+            bins[index] = value
+
+    densified = list(bins)
+    for index in range(NUM_BINS):
+        if bins[index] is None:
+            distance = 1
+            while bins[(index + distance) % NUM_BINS] is None:
+                distance += 1
+            # Offset by the distance so borrowed values differ from the bin they came from
+            densified[index] = bins[(index + distance) % NUM_BINS] + distance * DENSIFY_OFFSET
+    return tuple(densified)
+
+
+class NearDuplicateIndex:
+    """
+    Incremental MinHash/LSH index of short texts
+
+    Texts whose signatures agree on a whole band are candidates, and
+    candidates are confirmed with their exact shingle Jaccard similarity
+    and the same set of links.
+    Entries belong to a scope (for example an account) and only match
+    texts in the same scope. With a TTL, entries stop matching once they
+    are older than it.
+    """
+    DEFAULT_MAX_ENTRIES = 5000  # Oldest entries are evicted beyond this size
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # (scope, shingle hashes, band keys, links, added at) by key, oldest first
+        self._entries: OrderedDict[str, tuple[str, frozenset[int], list[tuple], frozenset[str], float]] = OrderedDict()
+        self._buckets: dict[tuple, set[str]] = {}
+
+    @staticmethod
+    def _band_keys(scope: str, text_signature: tuple) -> list[tuple]:
+        return [(scope, band, text_signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+    def add(self, key: str, text: str, scope: str = "") -> None:
+        """
+        Add or replace a text
+
+        Args:
+            key: Identifier of the text, such as a draft or tweet ID
+            text: Text content
+            scope: Only texts in the same scope are compared
+        """
+        shingle_hashes = shingles(text)
+        band_keys = self._band_keys(scope, signature(shingle_hashes))
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (scope, shingle_hashes, band_keys, links(text), time.monotonic())
+            for band_key in band_keys:
+                self._buckets.setdefault(band_key, set()).add(key)
+
+            self._prune()
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def remove(self, key: str) -> None:
+        """
+        Remove a text if present
+
+        Args:
+            key: Identifier of the text
+        """
+        with self._lock:
+            self._remove(key)
+
+    def _prune(self) -> None:
+        """
+        Drop entries older than the TTL
+
+        Must be called with the lock held.
+        """
+        if self.ttl is None:
+            return
+
+        # Entries are re-inserted when replaced, so the first ones are the oldest
+        expired_before = time.monotonic() - self.ttl
+        while self._entries and next(iter(self._entries.values()))[4] < expired_before:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        for band_key in entry[2]:
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def find(self, text: str, scope: str = "") -> list[tuple[str, float]]:
+        """
+        Find stored texts similar to a text
+
+        Args:
+            text: Text content
+            scope: Scope to search
+
+        Returns:
+            List of (key, similarity) at or above the threshold, most similar first
+        """
+        shingle_hashes = shingles(text)
+        band_keys = self._band_keys(scope, signature(shingle_hashes))
+        text_links = links(text)
+
+        matches = []
+        with self._lock:
+            self._prune()
+
+            candidates = set()
+            for band_key in band_keys:
+                candidates.update(self._buckets.get(band_key, ()))
+
+            for key in candidates:
+                _, stored, _, stored_links, _ = self._entries[key]
+                if stored_links != text_links:
+                    continue
+                similarity = len(shingle_hashes & stored) / len(shingle_hashes | stored)
+                if similarity >= self.threshold:
+                    matches.append((key, round(similarity, 3)))
+
+        return sorted(matches, key=lambda match: match[1], reverse=True)
+
+
+# Recently posted texts, scoped by account
+posted_index = NearDuplicateIndex(ttl=POSTED_TTL)
+
+
+def check_recent_posts(credentials: dict[str, Any], text: str, allow_duplicates: bool) -> tuple[list[dict[str, Any]], str]:
+    """
+    Check a tweet against the account's recent posts before calling the API
+
+    X rejects duplicate content, so near-duplicates are stopped unless the
+    caller allows them.
+
+    Args:
+        credentials: Provider credentials of the posting account
+        text: Tweet text
+        allow_duplicates: Whether near-duplicates may be posted anyway
+
+    Returns:
+        Tuple of (near_duplicates to add to the result, None), or ([], error message) if the tweet must not be posted
+    """
+    duplicates = posted_index.find(text, account_fingerprint(credentials))
+
+    if duplicates and not allow_duplicates:
+        tweet_id, similarity = duplicates[0]
+        return [], f"Tweet text is a near-duplicate of recently posted tweet {tweet_id} (similarity {similarity}). Set allow_duplicates to post anyway"
+
+    return [{"tweet_id": tweet_id, "similarity": similarity} for tweet_id, similarity in duplicates], None
+
+
+def record_post(credentials: dict[str, Any], tweet_id: str, text: str) -> None:
+    """
+    Add a posted tweet to the account's recent posts
+
+    Args:
+        credentials: Provider credentials of the posting account
+        tweet_id: ID of the posted tweet
+        text: Tweet text
+    """
+    posted_index.add(tweet_id, text, account_fingerprint(credentials))
+
+_draft_index = None
+_draft_index_lock = threading.Lock()
+
+
+def get_draft_index(drafts_dir: str = "drafts") -> NearDuplicateIndex:
+    """
+    Get the index of saved drafts, loading existing drafts on first use
+
+    Args:
+        drafts_dir: Directory drafts are saved in
+
+    Returns:
+        Index of draft contents keyed by draft ID
+    """
+    global _draft_index
+    with _draft_index_lock:
+        if _draft_index is None:
+            index = NearDuplicateIndex()
+            if os.path.isdir(drafts_dir):
+                for draft_id in sorted(os.listdir(drafts_dir)):
+                    if not draft_id.endswith(".json"):
+                        continue
+                    try:
+                        with open(os.path.join(drafts_dir, draft_id), "r") as f:
+                            content = json.load(f).get("content")
+                    except (OSError, ValueError):
+                        continue
+                    if content:
+                        index.add(draft_id, content)
+            _draft_index = index
+        return _draft_index
@@ -0,0 +1,251 @@
+import importlib.util
+import threading
+from collections import OrderedDict
+from typing import Any
+
+import httpx
+import requests
+from oauthlib.oauth1 import Client as OAuth1Client
+from requests.adapters import HTTPAdapter
+from requests_oauthlib import OAuth1Session
+
+from utils.idempotency import account_fingerprint, credentials_fingerprint
+
+
+POOL_SIZE = 8  # Connections kept open per host for each account (HTTP/1.1)
+HTTP2_MAX_CONNECTIONS = 4  # Connections per account; HTTP/2 normally needs one per host
+MAX_TRACKED_CONNECTIONS = 16  # Most recent connections kept in the statistics of each host
+MAX_SESSIONS = 64  # Sessions kept open; the least recently used are closed beyond this
+
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+
+# HTTP/2 needs the optional h2 package; without it every session uses HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# (credentials fingerprint, session) by account and transport, least recently used first
+_sessions: OrderedDict[tuple[str, bool], tuple[str, Any]] = OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+class HTTP2Session:
+    """
+    OAuth1-signed HTTP client that multiplexes requests over HTTP/2
+
+    Offers the subset of the OAuth1Session interface used by the tools, so
+    either can be passed around. Concurrent requests to the same host share
+    one connection, and servers that don't negotiate HTTP/2 are spoken to
+    over HTTP/1.1. Errors are raised as requests exceptions so existing
+    error handling keeps working. Like a requests session, a closed
+    session can still be used and reopens its connections.
+    """
+
+    def __init__(self, credentials: dict[str, Any]):
+        self._signer = OAuth1Client(
+            credentials["api_key"],
+            client_secret=credentials["api_secret"],
+            resource_owner_key=credentials["access_token"],
+            resource_owner_secret=credentials["access_token_secret"]
+        )
+        self._client = self._new_client()
+        self._lock = threading.Lock()
+        self._active = 0
+        self._closing = False
+        self._in_flight: dict[str, int] = {}
+        self._stats: dict[str, dict[str, Any]] = {}
+
+    @staticmethod
+    def _new_client() -> httpx.Client:
+        return httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=HTTP2_MAX_CONNECTIONS)
+        )
+
+    def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    def delete(self, url: str, **kwargs: Any) -> httpx.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def request(self, method: str, url: str, params: dict = None, data: dict = None, json: Any = None, files: dict = None, timeout: float = None) -> httpx.Response:
+        """
+        Sign and send a request
+
+        Args:
+            method: HTTP method
+            url: Request URL
+            params: Query parameters
+            data: Form fields
+            json: JSON body
+            files: Multipart files
+            timeout: Request timeout (seconds)
+
+        Returns:
+            Response with the whole body read
+        """
+        with self._lock:
+            if self._client.is_closed:
+                self._client = self._new_client()
+            client = self._client
+            # Counted from the start, so close() can't close the client under this request
+            self._active += 1
+
+        try:
+            return self._send(client, method, url, params=params, data=data, json=json, files=files, timeout=timeout)
+        finally:
+            with self._lock:
+                self._active -= 1
+                if self._closing and not self._active:
+                    self._close_client()
+
+    def _send(self, client: httpx.Client, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """
+        Sign and send a request with the given client, recording its statistics
+        """
+        request = client.build_request(method, url, **kwargs)
+
+        # Only form-encoded bodies are part of the OAuth1 signature, as in requests_oauthlib
+        content_type = request.headers.get("Content-Type", "")
+        body = request.read().decode() if content_type.startswith(FORM_CONTENT_TYPE) else None
+        _, headers, _ = self._signer.sign(
+            str(request.url),
+            http_method=method,
+            body=body,
+            headers={"Content-Type": content_type} if body is not None else None
+        )
+        request.headers["Authorization"] = headers["Authorization"]
+
+        host = request.url.host
+        with self._lock:
+            self._in_flight[host] = self._in_flight.get(host, 0) + 1
+            host_stats = self._stats.setdefault(host, {"requests": 0, "peak_concurrent_requests": 0, "connections": OrderedDict()})
+            host_stats["peak_concurrent_requests"] = max(host_stats["peak_concurrent_requests"], self._in_flight[host])
+
+        try:
+            response = client.send(request)
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+        finally:
+            with self._lock:
+                self._in_flight[host] -= 1
+
+        self._record(host, response)
+        return response
+
+    def _record(self, host: str, response: httpx.Response) -> None:
+        """
+        Count a completed request against the connection that carried it
+        """
+        # The network stream is shared by every request on the same connection. Tracked
+        # connections keep a reference to it, so its id can't be reused while tracked
+        network_stream = response.extensions.get("network_stream")
+        with self._lock:
+            host_stats = self._stats[host]
+            host_stats["requests"] += 1
+
+            connections = host_stats["connections"]
+            connection = connections.get(id(network_stream))
+            if connection is None:
+                connection = {"network_stream": network_stream, "http_version": response.http_version, "streams": 0}
+                connections[id(network_stream)] = connection
+                while len(connections) > MAX_TRACKED_CONNECTIONS:
+                    connections.popitem(last=False)
+            connection["streams"] += 1
+
+    def close(self) -> None:
+        """
+        Close the session's connections once its requests in flight have finished
+        """
+        with self._lock:
+            self._closing = True
+            if not self._active:
+                self._close_client()
+
+    def _close_client(self) -> None:
+        """
+        Close the HTTP client
+
+        Must be called with the lock held.
+        """
+        self._closing = False
+        self._client.close()
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """
+        Get request and stream counts by host
+
+        Returns:
+            For each host, the number of requests, the peak number of concurrent
+            requests and, for each of its most recent connections, the HTTP
+            version and stream count
+        """
+        with self._lock:
+            return {
+                host: {
+                    "requests": host_stats["requests"],
+                    "peak_concurrent_requests": host_stats["peak_concurrent_requests"],
+                    "connections": [
+                        {"http_version": connection["http_version"], "streams": connection["streams"]}
+                        for connection in host_stats["connections"].values()
+                    ]
+                }
+                for host, host_stats in self._stats.items()
+            }
+
+
+def get_session(credentials: dict[str, Any], http2: bool = None) -> Any:
+    """
+    Get the pooled session of an account
+
+    Sessions are kept for the life of the plugin process, so repeated and
+    concurrent requests for the same account reuse open connections. A
+    session is only reused with exactly the credentials it signs with, and
+    rotated credentials replace and close the account's previous session.
+    Beyond MAX_SESSIONS, the least recently used sessions are closed.
+
+    Args:
+        credentials: X API credentials of the account
+        http2: Whether to use HTTP/2. Defaults to the provider's HTTP Transport setting in credentials
+
+    Returns:
+        HTTP2Session, or OAuth1Session if HTTP/2 is disabled or unavailable
+    """
+    if http2 is None:
+        http2 = credentials.get("http_transport") == "http2"
+    http2 = http2 and HTTP2_AVAILABLE
+
+    key = (account_fingerprint(credentials), http2)
+    fingerprint = credentials_fingerprint(credentials)
+    with _sessions_lock:
+        cached = _sessions.get(key)
+        if cached and cached[0] == fingerprint:
+            _sessions.move_to_end(key)
+            return cached[1]
+
+        if cached:
+            cached[1].close()
+
+        if http2:
+            session = HTTP2Session(credentials)
+        else:
+            session = OAuth1Session(
+                credentials["api_key"],
+                client_secret=credentials["api_secret"],
+                resource_owner_key=credentials["access_token"],
+                resource_owner_secret=credentials["access_token_secret"]
+            )
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+        _sessions[key] = (fingerprint, session)
+        _sessions.move_to_end(key)
+
+        while len(_sessions) > MAX_SESSIONS:
+            _, (_, evicted) = _sessions.popitem(last=False)
+            evicted.close()
+
+        return session
+